@@ -41,41 +41,144 @@ Download: spa.traineddata
 
 Place the .traineddata file inside that tessdata folder.
 """
+import argparse
+import asyncio
 import io
 import logging
+import multiprocessing
+import shutil
+import tempfile
 import fitz  # PyMuPDF
-from openai import OpenAI
-import time
+import openai
+from openai import AsyncOpenAI
 import os
 import ssl
 from collections import Counter
 import traceback
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Optional
 import re
 import httpx
 from langchain_openai import AzureChatOpenAI
 
-import easyocr
+import torch
 from PIL import Image
 import numpy as np
 
-# Create reader once
-reader = easyocr.Reader(['en'])  # Add 'es' if you want multilingual
+from layout_helpers import (should_translate_text, is_protected_value, get_font_info, calculate_text_dimensions,
+                            font_line_height, text_fits)
+from translation_cache import cache, make_key, make_template, templatize_translation, fill_template
+
+logger = logging.getLogger(__name__)
+
+# OCR engine: batched EasyOCR on GPU; on CPU, PaddleOCR (much faster there)
+# with Tesseract as the fallback
+use_gpu = torch.cuda.is_available()
+reader = None
+paddle_ocr = None
+if use_gpu:
+    import easyocr
+else:
+    try:
+        from paddleocr import PaddleOCR
+        paddle_ocr = PaddleOCR(lang='en', use_angle_cls=False, enable_mkldnn=True, use_gpu=False)
+    except ImportError:
+        import pytesseract
+
+# Number of images per EasyOCR forward pass
+OCR_BATCH_SIZE = 16
+# Common size every image is resized to, so that all of them share batches
+OCR_WIDTH = 800
+OCR_HEIGHT = 1024
+
+def get_reader() -> "easyocr.Reader":
+    """
+    Create the EasyOCR reader on first use, in the process that runs the OCR:
+    CUDA must not be initialised before worker processes are started.
+    """
+    global reader
+    if reader is None:
+        reader = easyocr.Reader(['en'], gpu=True)  # Add 'es' if you want multilingual
+    return reader
 
 
 
 # Load custom SSL certificate and build HTTP client
 cert_data = os.environ.get("HUMANA_CERT")  # path to PEM or cert content
 ctx = ssl.create_default_context(cadata=cert_data)
-custom_client = httpx.Client(verify=ctx)
+
+# Shared HTTP/2 clients with pooled keep-alive connections, reused by every request
+http_limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+shared_client = httpx.Client(http2=True, verify=ctx, limits=http_limits)
+shared_async_client = httpx.AsyncClient(http2=True, verify=ctx, limits=http_limits)
 
 
-def ocr_with_easyocr(image: Image.Image) -> str:
-    # Convert PIL image to numpy array
-    image_np = np.array(image)
-    # Run OCR
-    results = reader.readtext(image_np, detail=0)
-    return "\n".join(results)
+def ocr_with_cpu_engine(image: Image.Image) -> str:
+    if paddle_ocr is not None:
+        # PaddleOCR expects BGR arrays; result[0] is None when nothing is found
+        result = paddle_ocr.ocr(np.array(image)[:, :, ::-1], cls=False)
+        lines = result[0] if result and result[0] else []
+        return "\n".join(line[1][0] for line in lines)
+    return pytesseract.image_to_string(image, lang='eng', config='--oem 1 --psm 6')
+
+def likely_has_text(image: Image.Image) -> bool:
+    """
+    Cheap pre-OCR gate: skip tiny images and flat images (logos, rules, fills)
+    that have too little edge energy or dark ink to contain text.
+    """
+    if image.width * image.height < 64 * 64:
+        return False
+    a = np.asarray(image.convert('L').resize((128, 128)), dtype=np.float32)
+    # 4-neighbour Laplacian, computed with array slicing
+    lap = a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4 * a[1:-1, 1:-1]
+    return lap.var() > 80 and (a < 128).mean() > 0.02
+
+def ocr_images_batched(doc: fitz.Document, page_nums: List[int]) -> Dict[Tuple[int, int], str]:
+    """
+    OCR every embedded image of the given pages, in batched EasyOCR calls
+    when running on GPU. Returns {(page_num, img_index): text}.
+    """
+    all_images = []
+    # Images such as logos are often shared by every page; decode each xref once per call
+    extracted = {}
+    for page_num in page_nums:
+        for img_index, img in enumerate(doc[page_num].get_images(full=True)):
+            xref = img[0]
+            try:
+                if xref not in extracted:
+                    extracted[xref] = doc.extract_image(xref)
+                base_image = extracted[xref]
+                image = Image.open(io.BytesIO(base_image["image"])).convert("RGB")
+            except Exception as e:
+                print(f"   ❌ Failed to extract image {img_index + 1} (xref {xref}) on page {page_num + 1}: {e}")
+                continue
+            if not likely_has_text(image):
+                continue
+            all_images.append((page_num, img_index, xref, image))
+
+    ocr_texts = {}
+    if not use_gpu:
+        for page_num, img_index, xref, image in all_images:
+            try:
+                ocr_texts[(page_num, img_index)] = ocr_with_cpu_engine(image)
+            except Exception as e:
+                print(f"   ❌ OCR failed for image {img_index + 1} (xref {xref}) on page {page_num + 1}: {e}")
+        return ocr_texts
+
+    if not all_images:
+        return ocr_texts
+    # EasyOCR only batches images of equal size; resizing all of them to one
+    # shape lets every image share the same forward passes
+    try:
+        results = get_reader().readtext_batched(
+            [np.asarray(entry[3]) for entry in all_images],
+            n_width=OCR_WIDTH, n_height=OCR_HEIGHT, batch_size=OCR_BATCH_SIZE, detail=0,
+        )
+    except Exception as e:
+        print(f"   ❌ Batched OCR failed for {len(all_images)} images: {e}")
+        return ocr_texts
+    for (page_num, img_index, _, _), lines in zip(all_images, results):
+        ocr_texts[(page_num, img_index)] = "\n".join(lines)
+    return ocr_texts
 
 # Init LLM via AzureChatOpenAI
 def get_llm_model(model_name="gpt-3.5-turbo", temperature=0.2):
@@ -85,53 +188,134 @@ def get_llm_model(model_name="gpt-3.5-turbo", temperature=0.2):
         api_version="2024-02-15-preview",  # or your correct version
         model=model_name,
         temperature=temperature,
-        http_client=custom_client
+        http_client=shared_client,
+        http_async_client=shared_async_client,
+        max_retries=3,
+        timeout=30.0
     )
 
 # Initialize model once
 # llm = get_llm_model()
 
 
-client = OpenAI(api_key="")
+# The SDK retries transient failures itself, with exponential backoff and jitter
+client = AsyncOpenAI(api_key="", http_client=shared_async_client, max_retries=3, timeout=30.0)
+
+MODEL_NAME = "gpt-3.5-turbo"
+TEMPERATURE = 0.2
+
+# Upper bound on page-range worker processes; PyMuPDF stops scaling beyond ~6
+MAX_WORKERS = 6
+
+# Maximum number of in-flight translation requests per process
+MAX_CONCURRENT_REQUESTS = 8
+_semaphore = None
+_semaphore_loop = None
+
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Return the request-limiting semaphore for the running event loop.
+    """
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        _semaphore_loop = loop
+    return _semaphore
 
  
-def should_translate_text(text: str) -> bool:
+# Common short terms with a fixed translation, served without an API call
+COMMON_TERMS = {
+    'copay': 'copago',
+    'deductible': 'deducible',
+    'premium': 'prima',
+    'plan': 'plan',
+    'year': 'año',
+    'services': 'servicios',
+    'coverage': 'cobertura',
+    'benefits': 'beneficios',
+    'maximum': 'máximo',
+    'monthly': 'mensual',
+    'medical': 'médico',
+    'hospital': 'hospital',
+    'inpatient': 'hospitalización',
+    'outpatient': 'ambulatorio'
+}
+
+# Warm the persistent cache with the common terms so cold starts hit it too
+cache.seed({
+    make_key(variant, "Spanish", MODEL_NAME, TEMPERATURE): translation
+    for term, translation in COMMON_TERMS.items()
+    for variant in (term, term.capitalize())
+})
+
+TRANSLATION_RULES = """RULES:
+1. Keep ALL numbers and currency exactly as they are
+2. Keep ALL codes unchanged: H5619136002, N/A, etc.
+3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
+4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
+5. Use standard medical/insurance Spanish terminology
+6. Keep formatting and punctuation exactly the same
+7. Return ONLY the translation, no explanations"""
+
+# Rough input budget per batched request (~4 characters per token)
+BATCH_MAX_TOKENS = 3000
+
+_NUMBERED_LINE_RE = re.compile(r'^\s*(\d+)[\.\)]\s*(.+)$', re.M)
+
+def lookup_common_term(text: str):
     """
-    Determine if text should be translated - be more conservative to preserve layout.
+    Return the fixed translation for a short common term, or None.
     """
-    text = text.strip()
-    
-    if not text:
-        return False
-    
-    # Don't translate pure numbers
-    if re.match(r'^\d+$', text):
-        return False
-    
-    # Don't translate currency amounts
-    if re.match(r'^\$\d+([,\d]*\.?\d*)?$', text):
-        return False
-    
-    # Don't translate codes/IDs
-    if re.match(r'^[A-Z0-9]{3,}$', text):
-        return False
-    
-    # Don't translate single characters or very short strings
-    if len(text) <= 2:
-        return False
-    
-    # Don't translate abbreviations
-    if text.upper() in ['N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC']:
-        return False
-    
-    # Don't translate if it's mostly numbers and special characters
-    alpha_chars = sum(1 for c in text if c.isalpha())
-    if alpha_chars < 3:
-        return False
+    if len(text.split()) <= 2:
+        return COMMON_TERMS.get(text.lower().strip())
+    return None
+
+def clean_translation(translated: str, target_lang: str) -> str:
+    """
+    Strip quotes and common response prefixes from a model answer.
+    """
+    translated = translated.strip().replace('"', '').replace("'", "")
+    prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
+    for prefix in prefixes:
+        if translated.startswith(prefix):
+            translated = translated[len(prefix):].strip()
+    return translated
+
+# Prefix of template cache keys; bumped when template extraction changes, so entries
+# built by an older version (e.g. with all-caps words taken for IDs) are never read
+TEMPLATE_KEY_PREFIX = "template:v2|"
+
+def get_cached_translation(text: str, target_lang: str):
+    """
+    Look up a translation by exact text first, then by its number/code template.
+    """
+    cached = cache.get(make_key(text, target_lang, MODEL_NAME, TEMPERATURE))
+    if cached is not None:
+        return cached
+    
+    template, values = make_template(text)
+    if not values:
+        return None
+    cached = cache.get(make_key(f"{TEMPLATE_KEY_PREFIX}{template}", target_lang, MODEL_NAME, TEMPERATURE))
+    if cached is None:
+        return None
+    return fill_template(cached, values)
+
+def store_translation(text: str, target_lang: str, translated: str) -> None:
+    """
+    Store the exact mapping and, when possible, the template mapping.
+    """
+    cache.set(make_key(text, target_lang, MODEL_NAME, TEMPERATURE), translated)
     
-    return True
+    template, values = make_template(text)
+    if not values:
+        return
+    template_translation = templatize_translation(translated, values)
+    if template_translation is not None:
+        cache.set(make_key(f"{TEMPLATE_KEY_PREFIX}{template}", target_lang, MODEL_NAME, TEMPERATURE), template_translation)
 
-def translate_text_conservative(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
+async def translate_text_conservative(text: str, target_lang: str = "Spanish") -> str:
     """
     Conservative translation that preserves structure.
     """
@@ -139,116 +323,138 @@ def translate_text_conservative(text: str, target_lang: str = "Spanish", retries
         return text
     
     # For very short text, be extra careful
-    if len(text.split()) <= 2:
-        # Check if it's a common term
-        common_terms = {
-            'copay': 'copago',
-            'deductible': 'deducible',
-            'premium': 'prima',
-            'plan': 'plan',
-            'year': 'año',
-            'services': 'servicios',
-            'coverage': 'cobertura',
-            'benefits': 'beneficios',
-            'maximum': 'máximo',
-            'monthly': 'mensual',
-            'medical': 'médico',
-            'hospital': 'hospital',
-            'inpatient': 'hospitalización',
-            'outpatient': 'ambulatorio'
-        }
-        
-        lower_text = text.lower().strip()
-        if lower_text in common_terms:
-            return common_terms[lower_text]
+    common = lookup_common_term(text)
+    if common is not None:
+        return common
+    
+    cached = get_cached_translation(text, target_lang)
+    if cached is not None:
+        return cached
     
     prompt = f"""Translate this English text to {target_lang}. This is from a medical insurance document.
 
-RULES:
-1. Keep ALL numbers and currency exactly as they are
-2. Keep ALL codes unchanged: H5619136002, N/A, etc.
-3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
-4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
-5. Use standard medical/insurance Spanish terminology
-6. Keep formatting and punctuation exactly the same
-7. Return ONLY the translation, no explanations
+{TRANSLATION_RULES}
 
 Text: "{text}"
 
 Translation:"""
     
-    for attempt in range(retries):
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+    try:
+        async with get_request_semaphore():
+            response = await client.chat.completions.create(
+                model=MODEL_NAME,
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
+                temperature=TEMPERATURE,
             )
-            translated =  response.choices[0].message.content.strip()
-            # response = llm.invoke(prompt) 
-            #translated = response.choices[0].message.content.strip()
-            # translated = response.content.strip()
-            translated = translated.replace('"', '').replace("'", "")
-            
-            # Clean up common response prefixes
-            prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
-            for prefix in prefixes:
-                if translated.startswith(prefix):
-                    translated = translated[len(prefix):].strip()
-            
-            return translated
-            
-        except Exception as e:
-            print(f"Translation attempt {attempt + 1} failed: {e}")
-            if attempt < retries - 1:
-                time.sleep(2 ** attempt)
+    except openai.APIError as e:
+        print(f"Translation failed: {e}")
+        return text
     
-    return text
+    translated =  response.choices[0].message.content.strip()
+    # response = llm.invoke(prompt) 
+    #translated = response.choices[0].message.content.strip()
+    # translated = response.content.strip()
+    translated = clean_translation(translated, target_lang)
+    store_translation(text, target_lang, translated)
+    return translated
 
-def get_font_info(span: Dict[str, Any]) -> Dict[str, Any]:
+def chunk_texts_by_tokens(texts: List[str], max_tokens: int = BATCH_MAX_TOKENS) -> List[List[str]]:
     """
-    Extract font information with better defaults and available fonts.
+    Split texts into groups whose estimated token count stays under max_tokens.
     """
-    font_name = span.get('font', '').lower()
-    flags = span.get('flags', 0)
-    size = span.get('size', 12)
-    
-    # Determine font type
-    is_bold = 'bold' in font_name or (flags & 16)
-    is_italic = 'italic' in font_name or (flags & 2)
-    
-    # Use standard fonts that are always available
-    if is_bold and is_italic:
-        font = "helv-boldoblique"
-    elif is_bold:
-        font = "helv-bold"
-    elif is_italic:
-        font = "helv-oblique"
-    else:
-        font = "helv"
-    
-    return {
-        'font': font,
-        'size': max(6, min(size, 24)),  # Reasonable size limits
-        'color': span.get('color', 0),
-        'flags': flags
-    }
+    chunks = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = len(text) // 4 + 4  # numbering and newline overhead
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def translate_numbered_chunk(texts: List[str], target_lang: str) -> Optional[Dict[str, str]]:
+    """
+    Translate a group of texts with a single numbered-list request.
+    Returns only the items the response could be mapped back to,
+    or None if the request failed.
+    """
+    numbered = "\n".join(f"{i}. {t.strip()}" for i, t in enumerate(texts, 1))
+    prompt = f"""Translate each numbered line below from English to {target_lang}. This is from a medical insurance document.
+
+{TRANSLATION_RULES}
+8. Return them in the same numbered format, one line per number
 
-def calculate_text_dimensions(text: str, font_size: float) -> Tuple[float, float]:
+{numbered}"""
+
+    try:
+        async with get_request_semaphore():
+            response = await client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=TEMPERATURE,
+            )
+    except openai.APIError as e:
+        print(f"Batch translation failed: {e}")
+        return None
+
+    content = response.choices[0].message.content or ""
+    results = {}
+    for num, translated in _NUMBERED_LINE_RE.findall(content):
+        index = int(num) - 1
+        if 0 <= index < len(texts):
+            results[texts[index]] = clean_translation(translated, target_lang)
+    return results
+
+async def translate_batch_conservative(texts: List[str], target_lang: str = "Spanish") -> Dict[str, str]:
     """
-    Calculate approximate text dimensions.
+    Translate many texts with as few requests as possible.
+    Returns a mapping of original text to translation.
     """
-    # Average character width is approximately 0.6 of font size for Helvetica
-    avg_char_width = font_size * 0.6
-    text_width = len(text) * avg_char_width
-    text_height = font_size * 1.2  # Include some line spacing
+    translations = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        if not should_translate_text(text):
+            translations[text] = text
+            continue
+        common = lookup_common_term(text)
+        if common is not None:
+            translations[text] = common
+            continue
+        cached = get_cached_translation(text, target_lang)
+        if cached is not None:
+            translations[text] = cached
+        else:
+            pending.append(text)
+
+    chunks = chunk_texts_by_tokens(pending)
+    chunk_results = await asyncio.gather(*[translate_numbered_chunk(c, target_lang) for c in chunks])
+    
+    mismatched = []
+    for chunk, results in zip(chunks, chunk_results):
+        for text in chunk:
+            if results is None:
+                translations[text] = text
+            elif text in results:
+                translations[text] = results[text]
+                store_translation(text, target_lang, results[text])
+            else:
+                mismatched.append(text)
     
-    return text_width, text_height
+    # Numbering mismatch: translate those items on their own
+    singles = await asyncio.gather(*[translate_text_conservative(t, target_lang) for t in mismatched])
+    translations.update(zip(mismatched, singles))
+
+    return translations
 
 def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float, float], 
                               text: str, font_info: Dict[str, Any]) -> bool:
     """
-    Insert text with multiple fallback strategies.
+    Insert text at the largest font size that fits, with a point-insert fallback.
     """
     if not text.strip():
         return False
@@ -275,51 +481,37 @@ def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float,
     else:
         color_rgb = (0, 0, 0)
     
-    # Strategy 1: Try original size and font
-    strategies = [
-        {'font': font_name, 'size': original_size, 'rect': original_rect},
-        {'font': font_name, 'size': original_size * 0.9, 'rect': original_rect},
-        {'font': font_name, 'size': original_size * 0.8, 'rect': original_rect},
-        {'font': 'helv', 'size': original_size, 'rect': original_rect},
-        {'font': 'helv', 'size': original_size * 0.9, 'rect': original_rect},
-        {'font': 'helv', 'size': 8, 'rect': original_rect},
-    ]
-    
-    # Strategy 2: Try with expanded rectangles
-    expanded_rect = fitz.Rect(x0, y0, x1 + 50, y1 + 5)
-    strategies.extend([
-        {'font': font_name, 'size': original_size, 'rect': expanded_rect},
-        {'font': 'helv', 'size': original_size, 'rect': expanded_rect},
-        {'font': 'helv', 'size': 8, 'rect': expanded_rect},
-    ])
-    
-    for strategy in strategies:
-        try:
-            rect = strategy['rect']
-            font = strategy['font']
-            size = strategy['size']
-            
-            # Ensure size is reasonable
-            if size < 6:
-                size = 6
-            elif size > 20:
-                size = 20
-            
-            result = page.insert_textbox(
-                rect,
-                text,
-                fontname=font,
-                fontsize=size,
-                color=color_rgb,
-                align=0,  # Left align
-                rotate=0
-            )
-            
-            if result >= 0:
-                return True
-                
-        except Exception as e:
-            continue
+    # Largest size predicted to fit the box, stepping down while insert_textbox
+    # still reports overflow (a negative rc; nothing is drawn then)
+    size = max(6, min(original_size, 20))
+    try:
+        fitz.get_text_length(text, fontname=font_name, fontsize=size)
+    except Exception:
+        font_name = 'helv'
+    while True:
+        if text_fits(original_rect, text, font_name, size):
+            try:
+                if page.insert_textbox(original_rect, text, fontname=font_name, fontsize=size,
+                                       color=color_rgb, align=0, rotate=0) >= 0:
+                    return True
+            except Exception:
+                pass
+        if size <= 6:
+            break
+        size = max(6, size * 0.9)
+    
+    # Nothing fits inside the box: grow it to hold the text at the minimum size, with
+    # slack for word wrapping and the full ascender-to-descender line height
+    text_width = fitz.get_text_length(text, fontname=font_name, fontsize=size)
+    rect = fitz.Rect(original_rect)
+    rect.x1 = max(rect.x1, rect.x0 + text_width * 1.1 + 2)
+    rect.y1 = max(rect.y1, rect.y0 + size * font_line_height(font_name) * 1.2)
+    try:
+        if page.insert_textbox(rect, text, fontname=font_name, fontsize=size,
+                               color=color_rgb, align=0, rotate=0) >= 0:
+            return True
+    except Exception:
+        pass
     
     # Last resort: Insert at point with minimal formatting
     try:
@@ -336,14 +528,14 @@ def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float,
         return False
 
 def create_better_redaction_rect(bbox: Tuple[float, float, float, float], 
-                                text: str, font_size: float) -> fitz.Rect:
+                                text: str, font_size: float, bold: bool = False) -> fitz.Rect:
     """
     Create a more accurate redaction rectangle.
     """
     x0, y0, x1, y1 = bbox
     
     # Calculate text dimensions
-    text_width, text_height = calculate_text_dimensions(text, font_size)
+    text_width, text_height = calculate_text_dimensions(text, font_size, bold)
     
     # Use the larger of the original bbox or calculated dimensions
     width = max(x1 - x0, text_width)
@@ -359,111 +551,232 @@ def create_better_redaction_rect(bbox: Tuple[float, float, float, float],
         y0 + height + padding
     )
 
-def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
+# A page span is a plain tuple: (text, bbox, font, flags, size, color)
+PageSpan = Tuple[str, Tuple[float, float, float, float], str, int, float, int]
+
+def extract_page_spans(page: fitz.Page) -> List[PageSpan]:
     """
-    Translate PDF while strictly preserving layout and positioning.
+    Extract text spans individually to preserve exact positioning.
     """
-    doc = fitz.open(input_pdf_path)
-    print(f"🔄 Starting layout-preserving translation of {len(doc)} pages to {target_lang}")
+    blocks = page.get_text("dict")["blocks"]
+    spans = [
+        (s['text'], s['bbox'], s['font'], s['flags'], s['size'], s['color'])
+        for b in blocks if 'lines' in b
+        for l in b['lines']
+        for s in l['spans']
+        if s['text'].strip() and s['bbox'][2] > s['bbox'][0] and s['bbox'][3] > s['bbox'][1]
+    ]
+    return merge_adjacent_spans(spans)
+
+def merge_adjacent_spans(spans: List[PageSpan]) -> List[PageSpan]:
+    """
+    Greedily merge consecutive same-style spans on the same line, so text runs
+    the PDF writer split up (e.g. "Part" "A" "Premium") are translated and
+    inserted as one unit. Numbers, amounts and codes are never merged.
+    """
+    spans = sorted(spans, key=lambda s: (s[1][1] // max(s[4], 1), s[1][0]))
+    merged = []
+    for span in spans:
+        text, bbox, font, flags, size, color = span
+        if merged:
+            prev_text, prev_bbox, prev_font, prev_flags, prev_size, prev_color = merged[-1]
+            gap = bbox[0] - prev_bbox[2]
+            if (abs(bbox[1] - prev_bbox[1]) < 1
+                    and -1 < gap < size * 0.5  # about one average character
+                    and font == prev_font and size == prev_size
+                    and not is_protected_value(text) and not is_protected_value(prev_text)):
+                separator = "" if prev_text.endswith(" ") or text.startswith(" ") or gap < size * 0.1 else " "
+                union = (prev_bbox[0], min(prev_bbox[1], bbox[1]), bbox[2], max(prev_bbox[3], bbox[3]))
+                merged[-1] = (prev_text + separator + text, union, prev_font, prev_flags, prev_size, prev_color)
+                continue
+        merged.append(span)
+    return merged
+
+def collect_unique_texts(individual_spans: List[PageSpan], seen: set) -> List[str]:
+    """
+    Return the translatable texts of a page that are not in `seen` yet,
+    adding them to it so each distinct string is requested only once.
+    """
+    unique_texts = []
+    for text, *_ in individual_spans:
+        if text not in seen and should_translate_text(text):
+            seen.add(text)
+            unique_texts.append(text)
+    return unique_texts
+
+def apply_page_translations(page: fitz.Page, page_num: int, individual_spans: List[PageSpan],
+                            translations: Dict[str, str]) -> None:
+    """
+    Redact the original spans and insert their translations in place.
+    """
+    counts = Counter({'translated': 0, 'unchanged': 0, 'inserted': 0, 'failed': 0})
+    try:
+        # Map translations back onto each span to maintain exact positioning
+        translation_tasks = []
+        for text, bbox, font, flags, size, color in individual_spans:
+            translated = translations.get(text, text)
+            logger.debug("'%s' -> '%s'", text, translated)
+            
+            # Only add to tasks if translation is different
+            if translated != text:
+                counts['translated'] += 1
+                translation_tasks.append({
+                    'original': text,
+                    'translated': translated,
+                    'bbox': bbox,
+                    'font_info': get_font_info(font, flags, size, color)
+                })
+            else:
+                counts['unchanged'] += 1
+        
+        # First, collect all redaction rectangles
+        redaction_rects = []
+        for task in translation_tasks:
+            bbox = task['bbox']
+            font_size = task['font_info']['size']
+            bold = task['font_info']['font'] in ('hebo', 'hebi')
+            redact_rect = create_better_redaction_rect(bbox, task['original'], font_size, bold)
+            redaction_rects.append(redact_rect)
+            page.add_redact_annot(redact_rect, fill=(1, 1, 1))  # White fill
+        
+        # Apply all redactions at once
+        page.apply_redactions()
+        
+        # Insert translated text in exact same positions
+        for task in translation_tasks:
+            translated = task['translated']
+            bbox = task['bbox']
+            font_info = task['font_info']
+            
+            if insert_text_with_fallbacks(page, bbox, translated, font_info):
+                counts['inserted'] += 1
+            else:
+                counts['failed'] += 1
+                logger.debug("Failed to insert: '%s' at %s", translated, bbox)
+        
+    except Exception as e:
+        print(f"   Error processing page {page_num + 1}: {e}")
+        traceback.print_exc()
+    
+    logger.info("page %d: %s", page_num + 1, dict(counts))
 
-    for page_num, page in enumerate(doc):
-        print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
+
+async def process_pages(doc: fitz.Document, lo: int, hi: int, target_lang: str) -> None:
+    """
+    Translate pages [lo, hi) in place. Translation requests for every page are
+    started up front, so later pages are translated while earlier ones are
+    being redacted and rewritten.
+    """
+    total_pages = len(doc)
+    page_spans = {}
+    for page_num in range(lo, hi):
         try:
-            process_images_on_page(page, target_lang)
+            page_spans[page_num] = extract_page_spans(doc[page_num])
+        except Exception as e:
+            print(f"   Error extracting text from page {page_num + 1}: {e}")
+            page_spans[page_num] = []
+
+    # Each distinct string is queued with the first page it appears on only;
+    # later pages reuse it from the accumulated translations
+    seen = set()
+    translation_futures = {
+        page_num: asyncio.ensure_future(
+            translate_batch_conservative(collect_unique_texts(spans, seen), target_lang)
+        )
+        for page_num, spans in page_spans.items()
+    }
+    translations = {}
+
+    # OCR all images of the range at once in a thread while the text translations
+    # are in flight; the document is not touched here until the OCR returns
+    ocr_texts = await asyncio.to_thread(ocr_images_batched, doc, list(range(lo, hi)))
+
+    for page_num in range(lo, hi):
+        page = doc[page_num]
+        print(f"\n📄 Processing page {page_num + 1}/{total_pages}")
+        try:
+            await process_images_on_page(page, page_num, target_lang, ocr_texts)
         except Exception as err:
             logging.error(err)
-        
+
         try:
-            # Extract text spans individually to preserve exact positioning
-            blocks = page.get_text("dict")["blocks"]
-            individual_spans = []
-            
-            for block in blocks:
-                if "lines" not in block:
-                    continue
-                
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        text = span["text"]
-                        if text and text.strip():
-                            bbox = span["bbox"]
-                            if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
-                                individual_spans.append({
-                                    'text': text,
-                                    'bbox': bbox,
-                                    'font_info': get_font_info(span)
-                                })
-            
-            print(f"   Found {len(individual_spans)} individual text spans")
-            
-            # Process each span individually to maintain exact positioning
-            translation_tasks = []
-            for span in individual_spans:
-                text = span['text']
-                
-                print(f"   Processing: '{text}' -> ", end="")
-                
-                translated = translate_text_conservative(text, target_lang)
-                print(f"'{translated}'")
-                
-                # Only add to tasks if translation is different
-                if translated != text:
-                    translation_tasks.append({
-                        'original': text,
-                        'translated': translated,
-                        'bbox': span['bbox'],
-                        'font_info': span['font_info']
-                    })
-            
-            print(f"   Will translate {len(translation_tasks)} spans")
-            
-            # First, collect all redaction rectangles
-            redaction_rects = []
-            for task in translation_tasks:
-                bbox = task['bbox']
-                font_size = task['font_info']['size']
-                redact_rect = create_better_redaction_rect(bbox, task['original'], font_size)
-                redaction_rects.append(redact_rect)
-                page.add_redact_annot(redact_rect, fill=(1, 1, 1))  # White fill
-            
-            # Apply all redactions at once
-            page.apply_redactions()
-            
-            # Insert translated text in exact same positions
-            successful_insertions = 0
-            for task in translation_tasks:
-                translated = task['translated']
-                bbox = task['bbox']
-                font_info = task['font_info']
-                
-                if insert_text_with_fallbacks(page, bbox, translated, font_info):
-                    successful_insertions += 1
-                else:
-                    print(f"   Failed to insert: '{translated}' at {bbox}")
-            
-            print(f"   Successfully inserted {successful_insertions}/{len(translation_tasks)} translations")
-            
+            translations.update(await translation_futures[page_num])
         except Exception as e:
-            print(f"   Error processing page {page_num + 1}: {e}")
-            traceback.print_exc()
-            continue
+            print(f"   Error translating page {page_num + 1}: {e}")
+        apply_page_translations(page, page_num, page_spans.pop(page_num), translations)
+
 
-    # Save the document
-    doc.save(output_pdf_path)
+def _init_worker(log_level: int) -> None:
+    logging.basicConfig(level=log_level, format="%(message)s")
+    # SQLite connections must not be shared across processes
+    cache.reopen()
+
+
+def _process_page_range(args: Tuple[str, str, int, int, str]) -> str:
+    """
+    Worker: translate pages [lo, hi) of the input PDF and save them to tmp_path.
+    """
+    input_pdf_path, target_lang, lo, hi, tmp_path = args
+    doc = fitz.open(input_pdf_path)
+    asyncio.run(process_pages(doc, lo, hi, target_lang))
+    doc.select(list(range(lo, hi)))
+    # Garbage collection drops the objects of pages outside this range
+    doc.save(tmp_path, garbage=4, deflate=True)
     doc.close()
+    return tmp_path
+
+
+def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
+    """
+    Translate PDF while strictly preserving layout and positioning.
+    Page ranges are processed in parallel worker processes and merged at the end.
+    """
+    with fitz.open(input_pdf_path) as doc:
+        total_pages = len(doc)
+        metadata, toc = doc.metadata, doc.get_toc(simple=False)
+    print(f"🔄 Starting layout-preserving translation of {total_pages} pages to {target_lang}")
+
+    workers = max(1, min(os.cpu_count() or 1, MAX_WORKERS, total_pages))
+    bounds = [round(i * total_pages / workers) for i in range(workers + 1)]
+    tmp_dir = tempfile.mkdtemp(prefix="pdf-translate-")
+    try:
+        tasks = [
+            (input_pdf_path, target_lang, bounds[i], bounds[i + 1], os.path.join(tmp_dir, f"part_{i}.pdf"))
+            for i in range(workers)
+        ]
+        if workers == 1:
+            part_paths = [_process_page_range(tasks[0])]
+        else:
+            # Spawned rather than forked: a forked child cannot use CUDA once the parent has touched it
+            with multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker,
+                                                           initargs=(logging.getLogger().getEffectiveLevel(),)) as pool:
+                part_paths = pool.map(_process_page_range, tasks)
+
+        # Merge the translated page ranges in order; the merged document starts empty,
+        # so it takes the input's metadata and outline
+        out = fitz.open()
+        for part_path in part_paths:
+            with fitz.open(part_path) as part:
+                out.insert_pdf(part)
+        out.set_metadata(metadata)
+        out.set_toc(toc)
+
+        # Save the document
+        out.save(output_pdf_path, garbage=4, deflate=True, deflate_images=True, clean=True)
+        out.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
     print(f"\n✅ Translation completed! Saved to: {output_pdf_path}")
 
 
-def get_image_rect_from_text_dict(page, xref):
-    """Get image rectangle from text dictionary"""
-    text_dict = page.get_text("dict")
-    for block in text_dict["blocks"]:
-        if block["type"] == 1:  # Image block
-            image_data = block.get("image")
-            if isinstance(image_data, dict):
-                if image_data.get("xref") == xref:
-                    return fitz.Rect(block["bbox"])
-    return None
+def build_image_rect_map(page: fitz.Page) -> Dict[int, fitz.Rect]:
+    """Map image xref -> placement rect from a single scan of the page"""
+    xref_map = {}
+    for info in page.get_image_info(xrefs=True):
+        xref = info.get("xref")
+        if xref and xref not in xref_map:
+            xref_map[xref] = fitz.Rect(info["bbox"])
+    return xref_map
 
 
 def get_image_rect_from_drawings(page, xref):
@@ -478,10 +791,16 @@ def get_image_rect_from_drawings(page, xref):
     return None
 
 
-def get_image_rect_comprehensive(page, xref):
+def get_image_rect_comprehensive(page, xref, xref_map):
     """Try multiple methods to get image rectangle"""
     
-    # Method 1: Try get_image_bbox (most reliable when it works)
+    # Method 1: Look up the per-page image map
+    img_rect = xref_map.get(xref)
+    if img_rect:
+        print(f"   ✅ Found bbox via image map: {img_rect}")
+        return img_rect
+    
+    # Method 2: Try get_image_bbox
     try:
         rects = page.get_image_bbox(xref)
         if rects:
@@ -490,61 +809,26 @@ def get_image_rect_comprehensive(page, xref):
     except Exception as e:
         print(f"   ⚠️ get_image_bbox failed for xref {xref}: {e}")
     
-    # Method 2: Try text dictionary method
-    img_rect = get_image_rect_from_text_dict(page, xref)
-    if img_rect:
-        print(f"   ✅ Found bbox via text_dict: {img_rect}")
-        return img_rect
-    
     # Method 3: Try drawings method
     img_rect = get_image_rect_from_drawings(page, xref)
     if img_rect:
         print(f"   ✅ Found bbox via drawings: {img_rect}")
         return img_rect
     
-    # Method 4: Try to find by matching image data
-    try:
-        target_image = page.parent.extract_image(xref)
-        text_dict = page.get_text("dict")
-        
-        for block in text_dict["blocks"]:
-            if block["type"] == 1:  # Image block
-                try:
-                    block_xref = block.get("image", {}).get("xref")
-                    if block_xref and block_xref == xref:
-                        rect = fitz.Rect(block["bbox"])
-                        print(f"   ✅ Found bbox via block matching: {rect}")
-                        return rect
-                except Exception:
-                    continue
-                    
-    except Exception as e:
-        print(f"   ⚠️ Image data matching failed: {e}")
-    
     return None
 
 
-def process_images_on_page(page: fitz.Page, target_lang: str):
+async def process_images_on_page(page: fitz.Page, page_num: int, target_lang: str,
+                                 ocr_texts: Dict[Tuple[int, int], str]):
     image_list = page.get_images(full=True)
     print(f"   Found {len(image_list)} images on page")
+    if not image_list:
+        return
+    xref_map = build_image_rect_map(page)
 
     for img_index, img in enumerate(image_list):
         xref = img[0]
-        
-        try:
-            base_image = page.parent.extract_image(xref)
-            image_bytes = base_image["image"]
-            img_ext = base_image["ext"]
-        except Exception as e:
-            print(f"   ❌ Failed to extract image {img_index + 1} (xref {xref}): {e}")
-            continue
- 
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            english_text = ocr_with_easyocr(image).strip()
-        except Exception as e:
-            print(f"   ❌ Failed to process image {img_index + 1} for OCR: {e}")
-            continue
+        english_text = ocr_texts.get((page_num, img_index), "").strip()
 
         if not english_text:
             print(f"   🖼️ Image {img_index + 1}: No text detected via OCR.")
@@ -553,14 +837,14 @@ def process_images_on_page(page: fitz.Page, target_lang: str):
         print(f"   🖼️ OCR Text: {english_text}")
  
         try:
-            translated_text = translate_text_conservative(english_text, target_lang)
+            translated_text = await translate_text_conservative(english_text, target_lang)
             print(f"   🔤 Translated OCR Text: {translated_text}")
         except Exception as e:
             print(f"   ❌ Translation failed for image {img_index + 1}: {e}")
             continue
  
         # Get image rectangle using comprehensive method
-        img_rect = get_image_rect_comprehensive(page, xref)
+        img_rect = get_image_rect_comprehensive(page, xref, xref_map)
         
         if not img_rect:
             print(f"   ❌ No bounding box found for xref {xref} after trying all methods")
@@ -582,6 +866,13 @@ def process_images_on_page(page: fitz.Page, target_lang: str):
 
 def main():
     """Main function to run the PDF translation."""
+    parser = argparse.ArgumentParser(description="Layout-preserving PDF translation")
+    parser.add_argument("--verbose", action="store_true", help="log every span translation")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
     try:
         # Configuration
         input_file = "img-pdf.pdf"
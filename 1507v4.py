@@ -41,26 +41,61 @@ Download: spa.traineddata
 
 Place the .traineddata file inside that tessdata folder.
 """
+import asyncio
+import functools
 import io
 import logging
+import math
 import fitz  # PyMuPDF
-from openai import OpenAI
-import time
+from openai import AsyncOpenAI
 import os
 import ssl
 from collections import Counter
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, List, Dict, Any
 import re
 import httpx
 from langchain_openai import AzureChatOpenAI
 
+from translation_cache import cache, make_key
+import trt_ocr
+
 import easyocr
-from PIL import Image, ImageDraw, ImageFont
+import torch
+from PIL import Image, ImageDraw, ImageFont, ImageStat
 import numpy as np
 
-# Create reader once
-reader = easyocr.Reader(['en'])  # Add 'es' if you want multilingual
+# Every image in a batch is resized to this shape so the GPU sees one input size
+OCR_BATCH_SIZE = 16
+OCR_WIDTH = 800
+OCR_HEIGHT = 1024
+
+# Created on first use (model loading is slow) and shared by all OCR threads
+_reader = None
+_reader_lock = threading.Lock()
+
+def get_reader() -> easyocr.Reader:
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                # cuDNN autotuning pays off with fixed-size batches
+                reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available(), cudnn_benchmark=True)  # Add 'es' if you want multilingual
+
+                if torch.cuda.is_available():
+                    # Run detector/recognizer through TensorRT FP16 engines when tensorrt is installed
+                    if trt_ocr.install_engines(reader):
+                        print("⚡ EasyOCR running on TensorRT engines")
+
+                    # Warm-up pass so cuDNN picks its kernels before the first real page
+                    reader.readtext_batched(
+                        np.zeros([OCR_BATCH_SIZE, OCR_HEIGHT, OCR_WIDTH, 3], dtype=np.uint8),
+                        n_width=OCR_WIDTH, n_height=OCR_HEIGHT, batch_size=OCR_BATCH_SIZE,
+                    )
+                _reader = reader
+    return _reader
 
 
 
@@ -70,13 +105,33 @@ ctx = ssl.create_default_context(cadata=cert_data)
 custom_client = httpx.Client(verify=ctx)
 
 
+def image_to_array(image: Image.Image) -> np.ndarray:
+    """
+    Wrap the raw bytes of an RGB PIL image as an HxWx3 uint8 array: tobytes() is the
+    only copy, and the array is a read-only view of it (EasyOCR never writes into its input).
+    EasyOCR takes RGB input as-is, so no channel reordering is needed.
+    """
+    return np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(image.height, image.width, 3)
+
 def ocr_with_easyocr(image: Image.Image) -> str:
     # Convert PIL image to numpy array
-    image_np = np.array(image)
+    image_np = image_to_array(image)
     # Run OCR
-    results = reader.readtext(image_np, detail=0)
+    results = get_reader().readtext(image_np, detail=0)
     return "\n".join(results)
 
+def ocr_images_batched(images: List[Image.Image]) -> List[str]:
+    """
+    OCR several images in one batched EasyOCR call.
+    """
+    if not images:
+        return []
+    results = get_reader().readtext_batched(
+        [image_to_array(image) for image in images],
+        n_width=OCR_WIDTH, n_height=OCR_HEIGHT, batch_size=OCR_BATCH_SIZE, detail=0,
+    )
+    return ["\n".join(lines) for lines in results]
+
 # Init LLM via AzureChatOpenAI
 def get_llm_model(model_name="gpt-3.5-turbo", temperature=0.2):
     return AzureChatOpenAI(
@@ -92,9 +147,31 @@ def get_llm_model(model_name="gpt-3.5-turbo", temperature=0.2):
 # llm = get_llm_model()
 
 
-client = OpenAI(api_key="")
+client = AsyncOpenAI(api_key="")
+
+# Cap on API requests in flight at once
+MAX_CONCURRENT_REQUESTS = 16
+_semaphore = None
+_semaphore_loop = None
+
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Return the request-limiting semaphore for the running event loop.
+    """
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        _semaphore_loop = loop
+    return _semaphore
 
  
+# Patterns for text that is kept as-is, compiled once at import
+_RE_NUM = re.compile(r'^\d+$')
+_RE_CURRENCY = re.compile(r'^\$\d+([,\d]*\.?\d*)?$')
+_RE_CODE = re.compile(r'^[A-Z0-9]{3,}$')
+_SKIP_ABBREVS = frozenset({'N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC'})
+
 def should_translate_text(text: str) -> bool:
     """
     Determine if text should be translated - be more conservative to preserve layout.
@@ -105,15 +182,15 @@ def should_translate_text(text: str) -> bool:
         return False
     
     # Don't translate pure numbers
-    if re.match(r'^\d+$', text):
+    if _RE_NUM.match(text):
         return False
     
     # Don't translate currency amounts
-    if re.match(r'^\$\d+([,\d]*\.?\d*)?$', text):
+    if _RE_CURRENCY.match(text):
         return False
     
     # Don't translate codes/IDs
-    if re.match(r'^[A-Z0-9]{3,}$', text):
+    if _RE_CODE.match(text):
         return False
     
     # Don't translate single characters or very short strings
@@ -121,17 +198,95 @@ def should_translate_text(text: str) -> bool:
         return False
     
     # Don't translate abbreviations
-    if text.upper() in ['N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC']:
+    if text.upper() in _SKIP_ABBREVS:
         return False
     
-    # Don't translate if it's mostly numbers and special characters
-    alpha_chars = sum(1 for c in text if c.isalpha())
-    if alpha_chars < 3:
+    # Don't translate if it's mostly numbers and special characters;
+    # stop scanning as soon as three letters have been seen
+    alpha_chars = 0
+    for c in text:
+        if c.isalpha():
+            alpha_chars += 1
+            if alpha_chars >= 3:
+                break
+    else:
         return False
     
     return True
 
-def translate_text_conservative(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
+TRANSLATION_RULES = """RULES:
+1. Keep ALL numbers and currency exactly as they are
+2. Keep ALL codes unchanged: H5619136002, N/A, etc.
+3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
+4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
+5. Use standard medical/insurance Spanish terminology
+6. Keep formatting and punctuation exactly the same"""
+
+MODEL_NAME = "gpt-3.5-turbo"
+
+# Persistent cache entries older than this are re-translated
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+# In-process copy of translations already looked up this run
+_TRANSLATION_CACHE: Dict[Tuple[str, str], str] = {}
+
+def get_cached_translation(text: str, target_lang: str):
+    """
+    Return a cached translation from memory or the on-disk cache, or None.
+    """
+    translated = _TRANSLATION_CACHE.get((text, target_lang))
+    if translated is None:
+        translated = cache.get(make_key(text, target_lang, MODEL_NAME), max_age=CACHE_MAX_AGE)
+        if translated is not None:
+            _TRANSLATION_CACHE[(text, target_lang)] = translated
+    return translated
+
+def store_translation(text: str, target_lang: str, translated: str) -> None:
+    _TRANSLATION_CACHE[(text, target_lang)] = translated
+    cache.set(make_key(text, target_lang, MODEL_NAME), translated)
+
+# Upper bound on the text sent in one batched request
+BATCH_MAX_CHARS = 4000
+BATCH_DELIMITER = "%%"
+
+# Fixed translations for short common terms, answered without a request
+COMMON_TERMS = {
+    'copay': 'copago',
+    'deductible': 'deducible',
+    'premium': 'prima',
+    'plan': 'plan',
+    'year': 'año',
+    'services': 'servicios',
+    'coverage': 'cobertura',
+    'benefits': 'beneficios',
+    'maximum': 'máximo',
+    'monthly': 'mensual',
+    'medical': 'médico',
+    'hospital': 'hospital',
+    'inpatient': 'hospitalización',
+    'outpatient': 'ambulatorio'
+}
+
+def lookup_common_term(text: str):
+    """
+    Return the fixed translation for a short common term, or None.
+    """
+    if len(text.split()) <= 2:
+        return COMMON_TERMS.get(text.lower().strip())
+    return None
+
+def clean_translation(translated: str, target_lang: str) -> str:
+    """
+    Strip quotes and common response prefixes from a model answer.
+    """
+    translated = translated.strip().replace('"', '').replace("'", "")
+    prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
+    for prefix in prefixes:
+        if translated.startswith(prefix):
+            translated = translated[len(prefix):].strip()
+    return translated
+
+async def translate_text_conservative(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
     """
     Conservative translation that preserves structure.
     """
@@ -139,38 +294,17 @@ def translate_text_conservative(text: str, target_lang: str = "Spanish", retries
         return text
     
     # For very short text, be extra careful
-    if len(text.split()) <= 2:
-        # Check if it's a common term
-        common_terms = {
-            'copay': 'copago',
-            'deductible': 'deducible',
-            'premium': 'prima',
-            'plan': 'plan',
-            'year': 'año',
-            'services': 'servicios',
-            'coverage': 'cobertura',
-            'benefits': 'beneficios',
-            'maximum': 'máximo',
-            'monthly': 'mensual',
-            'medical': 'médico',
-            'hospital': 'hospital',
-            'inpatient': 'hospitalización',
-            'outpatient': 'ambulatorio'
-        }
-        
-        lower_text = text.lower().strip()
-        if lower_text in common_terms:
-            return common_terms[lower_text]
+    common = lookup_common_term(text)
+    if common is not None:
+        return common
+
+    cached = get_cached_translation(text, target_lang)
+    if cached is not None:
+        return cached
     
     prompt = f"""Translate this English text to {target_lang}. This is from a medical insurance document.
 
-RULES:
-1. Keep ALL numbers and currency exactly as they are
-2. Keep ALL codes unchanged: H5619136002, N/A, etc.
-3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
-4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
-5. Use standard medical/insurance Spanish terminology
-6. Keep formatting and punctuation exactly the same
+{TRANSLATION_RULES}
 7. Return ONLY the translation, no explanations
 
 Text: "{text}"
@@ -179,32 +313,116 @@ Translation:"""
     
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-            )
-            translated =  response.choices[0].message.content.strip()
+            async with get_request_semaphore():
+                response = await client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2,
+                )
             # response = llm.invoke(prompt) 
-            #translated = response.choices[0].message.content.strip()
             # translated = response.content.strip()
-            translated = translated.replace('"', '').replace("'", "")
-            
-            # Clean up common response prefixes
-            prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
-            for prefix in prefixes:
-                if translated.startswith(prefix):
-                    translated = translated[len(prefix):].strip()
+            translated = clean_translation(response.choices[0].message.content, target_lang)
             
+            store_translation(text, target_lang, translated)
             return translated
             
         except Exception as e:
             print(f"Translation attempt {attempt + 1} failed: {e}")
             if attempt < retries - 1:
-                time.sleep(2 ** attempt)
+                await asyncio.sleep(2 ** attempt)
     
     return text
 
+def chunk_texts(texts: List[str], max_chars: int = BATCH_MAX_CHARS) -> List[List[str]]:
+    """
+    Split texts into batches whose combined length stays under max_chars.
+    """
+    batches = []
+    current = []
+    current_len = 0
+    for text in texts:
+        if current and current_len + len(text) > max_chars:
+            batches.append(current)
+            current = []
+            current_len = 0
+        current.append(text)
+        current_len += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+async def translate_batch_conservative(texts: List[str], target_lang: str = "Spanish") -> Dict[str, str]:
+    """
+    Translate several texts with one API call. Items are separated by "%%" in both
+    the prompt and the reply; if the reply does not line up, fall back to per-item calls.
+    """
+    # Common terms and cached texts are answered here, as translate_text_conservative would
+    results = {}
+    misses = []
+    for text in texts:
+        known = lookup_common_term(text)
+        if known is None:
+            known = get_cached_translation(text, target_lang)
+        if known is not None:
+            results[text] = known
+        else:
+            misses.append(text)
+    texts = misses
+
+    if not texts:
+        return results
+    if len(texts) == 1:
+        results[texts[0]] = await translate_text_conservative(texts[0], target_lang)
+        return results
+
+    joined = f"\n{BATCH_DELIMITER}\n".join(texts)
+    prompt = f"""Translate each item below from English to {target_lang}. This is from a medical insurance document.
+Items are separated by lines containing only {BATCH_DELIMITER}.
+
+{TRANSLATION_RULES}
+7. Return ONLY the translations, in the same order, separated by lines containing only {BATCH_DELIMITER}
+
+{joined}"""
+
+    try:
+        async with get_request_semaphore():
+            response = await client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+            )
+        parts = [part.strip() for part in response.choices[0].message.content.split(BATCH_DELIMITER)]
+        parts = [part for part in parts if part]
+        if len(parts) == len(texts):
+            for text, part in zip(texts, parts):
+                results[text] = clean_translation(part, target_lang)
+                store_translation(text, target_lang, results[text])
+            return results
+        print(f"   ⚠️ Batch returned {len(parts)} items for {len(texts)} texts, translating one by one")
+    except Exception as e:
+        print(f"   ⚠️ Batch translation failed: {e}")
+
+    singles = await asyncio.gather(*(translate_text_conservative(text, target_lang) for text in texts))
+    results.update(zip(texts, singles))
+    return results
+
+async def translate_texts(texts: List[str], target_lang: str = "Spanish") -> Dict[str, str]:
+    """
+    Translate unique texts in concurrent batches; failed batches keep their originals.
+    """
+    batches = chunk_texts(texts)
+    results = await asyncio.gather(
+        *(translate_batch_conservative(batch, target_lang) for batch in batches),
+        return_exceptions=True,
+    )
+    translations = {}
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            print(f"   ⚠️ Batch of {len(batch)} texts failed: {result}")
+            continue
+        translations.update(result)
+    return translations
+
 def get_font_info(span: Dict[str, Any]) -> Dict[str, Any]:
     """
     Extract font information with better defaults and available fonts.
@@ -217,13 +435,14 @@ def get_font_info(span: Dict[str, Any]) -> Dict[str, Any]:
     is_bold = 'bold' in font_name or (flags & 16)
     is_italic = 'italic' in font_name or (flags & 2)
     
-    # Use standard fonts that are always available
+    # Use the Base-14 Helvetica variants, which are always available; PyMuPDF only
+    # knows them by their short names (hebo, heit, hebi)
     if is_bold and is_italic:
-        font = "helv-boldoblique"
+        font = "hebi"
     elif is_bold:
-        font = "helv-bold"
+        font = "hebo"
     elif is_italic:
-        font = "helv-oblique"
+        font = "heit"
     else:
         font = "helv"
     
@@ -245,10 +464,28 @@ def calculate_text_dimensions(text: str, font_size: float) -> Tuple[float, float
     
     return text_width, text_height
 
+@functools.lru_cache(maxsize=None)
+def font_line_height(fontname: str) -> float:
+    """
+    Line height of a font as a multiple of its size, as insert_textbox lays lines out.
+    """
+    font = fitz.Font(fontname)
+    return font.ascender - font.descender
+
+def text_fits(rect: fitz.Rect, text: str, fontname: str, size: float) -> bool:
+    """
+    Predict whether text wraps into rect at the given size, from its measured width.
+    """
+    if rect.width <= 0:
+        return False
+    text_width = fitz.get_text_length(text, fontname=fontname, fontsize=size)
+    lines = max(1, math.ceil(text_width / rect.width))
+    return lines * size * font_line_height(fontname) <= rect.height
+
 def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float, float], 
                               text: str, font_info: Dict[str, Any]) -> bool:
     """
-    Insert text with multiple fallback strategies.
+    Insert text at the largest font size that fits, with a point-insert fallback.
     """
     if not text.strip():
         return False
@@ -275,51 +512,37 @@ def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float,
     else:
         color_rgb = (0, 0, 0)
     
-    # Strategy 1: Try original size and font
-    strategies = [
-        {'font': font_name, 'size': original_size, 'rect': original_rect},
-        {'font': font_name, 'size': original_size * 0.9, 'rect': original_rect},
-        {'font': font_name, 'size': original_size * 0.8, 'rect': original_rect},
-        {'font': 'helv', 'size': original_size, 'rect': original_rect},
-        {'font': 'helv', 'size': original_size * 0.9, 'rect': original_rect},
-        {'font': 'helv', 'size': 8, 'rect': original_rect},
-    ]
-    
-    # Strategy 2: Try with expanded rectangles
-    expanded_rect = fitz.Rect(x0, y0, x1 + 50, y1 + 5)
-    strategies.extend([
-        {'font': font_name, 'size': original_size, 'rect': expanded_rect},
-        {'font': 'helv', 'size': original_size, 'rect': expanded_rect},
-        {'font': 'helv', 'size': 8, 'rect': expanded_rect},
-    ])
+    # Largest size predicted to fit the box, stepping down while insert_textbox
+    # still reports overflow (a negative rc; nothing is drawn then)
+    size = max(6, min(original_size, 20))
+    try:
+        fitz.get_text_length(text, fontname=font_name, fontsize=size)
+    except Exception:
+        font_name = 'helv'
+    while True:
+        if text_fits(original_rect, text, font_name, size):
+            try:
+                if page.insert_textbox(original_rect, text, fontname=font_name, fontsize=size,
+                                       color=color_rgb, align=0, rotate=0) >= 0:
+                    return True
+            except Exception:
+                pass
+        if size <= 6:
+            break
+        size = max(6, size * 0.9)
     
-    for strategy in strategies:
-        try:
-            rect = strategy['rect']
-            font = strategy['font']
-            size = strategy['size']
-            
-            # Ensure size is reasonable
-            if size < 6:
-                size = 6
-            elif size > 20:
-                size = 20
-            
-            result = page.insert_textbox(
-                rect,
-                text,
-                fontname=font,
-                fontsize=size,
-                color=color_rgb,
-                align=0,  # Left align
-                rotate=0
-            )
-            
-            if result >= 0:
-                return True
-                
-        except Exception as e:
-            continue
+    # Nothing fits inside the box: grow it to hold the text at the minimum size, with
+    # slack for word wrapping and the full ascender-to-descender line height
+    text_width = fitz.get_text_length(text, fontname=font_name, fontsize=size)
+    rect = fitz.Rect(original_rect)
+    rect.x1 = max(rect.x1, rect.x0 + text_width * 1.1 + 2)
+    rect.y1 = max(rect.y1, rect.y0 + size * font_line_height(font_name) * 1.2)
+    try:
+        if page.insert_textbox(rect, text, fontname=font_name, fontsize=size,
+                               color=color_rgb, align=0, rotate=0) >= 0:
+            return True
+    except Exception:
+        pass
     
     # Last resort: Insert at point with minimal formatting
     try:
@@ -361,11 +584,10 @@ def create_better_redaction_rect(bbox: Tuple[float, float, float, float],
 
 
 
-def get_image_rect_fallback1(page: fitz.Page, xref: int):
-    """Fallback to get image bbox from text dictionary structure."""
+def get_image_rect_fallback1(page_dict: Dict[str, Any], xref: int):
+    """Fallback to get image bbox from the page's cached text dictionary."""
     try:
-        blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
+        for block in page_dict["blocks"]:
             if block["type"] == 1:
                 image_data = block.get("image")
                 if isinstance(image_data, dict) and image_data.get("xref") == xref:
@@ -384,8 +606,8 @@ def get_image_rect_fallback(page: fitz.Page, xref: int):
     return None
 
 def ocr_with_easyocr(image: Image.Image) -> str:
-    image_np = np.array(image)
-    results = reader.readtext(image_np, detail=0)
+    image_np = image_to_array(image)
+    results = get_reader().readtext(image_np, detail=0)
     return "\n".join(results)
 
 def draw_translated_text_on_image(image: Image.Image, translated_text: str) -> Image.Image:
@@ -435,19 +657,49 @@ def get_image_rect_from_size(page: fitz.Page, image: Image.Image, position: str
     return rect
 
 
-def replace_image_with_translated(page: fitz.Page,img_name, xref: int, page_num: int, img_index: int, target_lang: str):
+def load_image(doc: fitz.Document, xref: int):
     try:
-        image_info = page.parent.extract_image(xref)
-        image_bytes = image_info["image"]
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        image_info = doc.extract_image(xref)
+        return Image.open(io.BytesIO(image_info["image"])).convert("RGB")
+    except Exception as e:
+        print(f"❌ Could not decode image xref {xref}: {e}")
+        return None
 
-        english_text = ocr_with_easyocr(image).strip()
+# Images smaller than this (in pixels) or flatter than this (grayscale std-dev) are not OCR'd
+MIN_OCR_PIXELS = 10000
+MIN_OCR_STDDEV = 15
+
+def should_ocr_image(page: fitz.Page, img_name, image: Image.Image) -> bool:
+    """
+    Cheap pre-filter that skips logos, icons and flat fills before OCR.
+    """
+    if image.width * image.height < MIN_OCR_PIXELS:
+        return False
+    if ImageStat.Stat(image.convert("L")).stddev[0] < MIN_OCR_STDDEV:
+        return False
+    # Text the page already exposes over the image is handled by the span pass
+    try:
+        rect = page.get_image_bbox(img_name)
+        if rect.is_valid and not rect.is_empty and page.get_text("text", clip=rect).strip():
+            return False
+    except Exception:
+        pass
+    return True
+
+async def replace_image_with_translated(page: fitz.Page,img_name, xref: int, page_num: int, img_index: int, target_lang: str,
+                                       image: Image.Image, english_text: str, page_dict: Dict[str, Any]):
+    """
+    Draw the translated OCR text onto the image. Returns (rect, image bytes) for the
+    caller to insert once the page's redactions are applied, or None.
+    """
+    try:
+        english_text = english_text.strip()
         if not english_text:
             print(f"   🖼️ Image {img_index + 1}: No OCR text detected.")
-            return
+            return None
 
         print(f"   🖼️ OCR Text: {english_text}")
-        translated_text = translate_text_conservative(english_text, target_lang)
+        translated_text = await translate_text_conservative(english_text, target_lang)
         print(f"   🔤 Translated OCR Text: {translated_text}")
 
         updated_image = draw_translated_text_on_image(image, translated_text)
@@ -457,14 +709,14 @@ def replace_image_with_translated(page: fitz.Page,img_name, xref: int, page_num:
 
         # Try to get bounding box
         try:
-            rects = page.get_image_bbox(img_name)
-            img_rect = rects[0] if rects else None
-            fake_rect = rects
+            img_rect = page.get_image_bbox(img_name)
         except Exception as e:
-            rects = page.get_image_bbox(xref)
             print(f"⚠️ get_image_bbox failed for xref {xref}: {e}")
             img_rect = None
 
+        if not img_rect or img_rect.is_empty or img_rect.is_infinite:
+            img_rect = get_image_rect_fallback1(page_dict, xref)
+
         if not img_rect:
             print(f"❌ No bounding box found for image xref {xref}, skipping replacement.")
             img_rect = get_image_rect_from_size(page, updated_image, position="top-left")
@@ -484,44 +736,97 @@ def replace_image_with_translated(page: fitz.Page,img_name, xref: int, page_num:
         img_stream.seek(0)
 
 
-        rect = fitz.Rect(fake_rect[0], fake_rect[1], fake_rect[2], fake_rect[3])
-        
-        shape = page.new_shape()
-        shape.draw_rect(rect)
-        shape.finish(fill=(1.0, 0, 0))
-        shape.commit()
-
-        page.insert_image(
-        rect,
-        stream=img_stream.getvalue(),
-        overlay=True,
-        keep_proportion=False  # important
-        )
-        print(f"✅ Replaced image xref {xref} at {img_rect}")
+        return fitz.Rect(img_rect), img_stream.getvalue()
 
     except Exception as e:
         print(f"❌ Error processing image xref {xref}: {e}")
+        return None
 
-def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
-    doc = fitz.open(input_pdf_path)
-    print(f"🔄 Starting layout-preserving translation of {len(doc)} pages to {target_lang}")
+def collect_page_spans(page_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Collect the non-empty text spans from a page's text dictionary.
+    """
+    blocks = page_dict["blocks"]
+    individual_spans = []
+    for block in blocks:
+        if "lines" not in block:
+            continue
+        for line in block["lines"]:
+            for span in line["spans"]:
+                text = span["text"]
+                if text and text.strip():
+                    bbox = span["bbox"]
+                    if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+                        individual_spans.append({
+                            'text': text,
+                            'bbox': bbox,
+                            'font_info': get_font_info(span)
+                        })
+    return individual_spans
+
+def load_page_images(doc: fitz.Document, page: fitz.Page):
+    """
+    Decode a page's embedded images; ones not worth OCR'ing come back as None.
+    """
+    # ✅ PREVENT MODIFICATION SIDE-EFFECTS
+    # Extract image metadata upfront
+    image_refs = [(img[0], img[7]) for img in page.get_images(full=True)]  # (xref, name)
+    images = [load_image(doc, xref) for xref, _ in image_refs]
+    images = [
+        image if image is not None and should_ocr_image(page, name, image) else None
+        for image, (_, name) in zip(images, image_refs)
+    ]
+    return image_refs, images
+
+async def translate_document(doc: fitz.Document, target_lang: str) -> None:
+    # Parse each page's content once; spans and image-bbox lookups share it.
+    # Spans for every page are gathered first so all batches can go out together.
+    page_dicts = [page.get_text("dict") for page in doc]
+    page_spans = [collect_page_spans(page_dict) for page_dict in page_dicts]
+    unique_texts = list(dict.fromkeys(
+        span['text'] for spans in page_spans for span in spans if should_translate_text(span['text'])
+    ))
+
+    # PyMuPDF is not thread-safe, so pages are read and edited on this thread only.
+    # OCR runs on a single worker thread (torch releases the GIL) while translations are
+    # in flight: the shared reader and its TensorRT sessions reuse one execution context
+    # and buffers, so they must not be called concurrently, and one batch at a time
+    # bounds GPU memory
+    page_images = [load_page_images(doc, page) for page in doc]
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        ocr_futures = [
+            loop.run_in_executor(executor, ocr_images_batched, [image for image in images if image is not None])
+            for _, images in page_images
+        ]
+        print(f"   Translating {len(unique_texts)} unique texts")
+        translations = await translate_texts(unique_texts, target_lang)
+        ocr_results = await asyncio.gather(*ocr_futures, return_exceptions=True)
 
     for page_num, page in enumerate(doc):
         print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
 
         try:
             # 🔁 IMAGE OCR + TRANSLATION
-            image_list = page.get_images(full=True)
-
-            # ✅ PREVENT MODIFICATION SIDE-EFFECTS
-            # Extract image metadata upfront
-            image_refs = [(img[0], img[7]) for img in image_list]  # (xref, name)
-
+            # Replacement images wait until after the page's single redaction pass
+            image_inserts = []
+            image_refs, images = page_images[page_num]
             print(f"   Found {len(image_refs)} images")
 
+            if isinstance(ocr_results[page_num], Exception):
+                raise ocr_results[page_num]
+            ocr_texts = iter(ocr_results[page_num])
+
             for img_index, (xref, name) in enumerate(image_refs):
+                image = images[img_index]
+                if image is None:
+                    continue
+                english_text = next(ocr_texts)
                 try: 
-                    replace_image_with_translated(page, name, xref, page_num, img_index, target_lang)
+                    replacement = await replace_image_with_translated(page, name, xref, page_num, img_index, target_lang,
+                                                                      image, english_text, page_dicts[page_num])
+                    if replacement:
+                        image_inserts.append((xref, replacement))
                 except Exception as e:
                     print(f"   ⚠️ Failed to process image {img_index + 1}: {e}")
                     traceback.print_exc()
@@ -533,31 +838,13 @@ def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, t
 
         try:
             # TEXT SPAN TRANSLATION
-            blocks = page.get_text("dict")["blocks"]
-            individual_spans = []
-            for block in blocks:
-                if "lines" not in block:
-                    continue
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        text = span["text"]
-                        if text and text.strip():
-                            bbox = span["bbox"]
-                            if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
-                                individual_spans.append({
-                                    'text': text,
-                                    'bbox': bbox,
-                                    'font_info': get_font_info(span)
-                                })
-
+            individual_spans = page_spans[page_num]
             print(f"   Found {len(individual_spans)} individual text spans")
 
             translation_tasks = []
             for span in individual_spans:
                 text = span['text']
-                print(f"   Processing: '{text}' -> ", end="")
-                translated = translate_text_conservative(text, target_lang)
-                print(f"'{translated}'")
+                translated = translations.get(text, text)
                 if translated != text:
                     translation_tasks.append({
                         'original': text,
@@ -577,8 +864,18 @@ def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, t
                 redaction_rects.append(redact_rect)
                 page.add_redact_annot(redact_rect, fill=(1, 1, 1))
 
+            # One redaction pass per page, then all replacement content on top
             page.apply_redactions()
 
+            for xref, (rect, img_bytes) in image_inserts:
+                page.insert_image(
+                rect,
+                stream=img_bytes,
+                overlay=True,
+                keep_proportion=False  # important
+                )
+                print(f"✅ Replaced image xref {xref} at {rect}")
+
             successful_insertions = 0
             for task in translation_tasks:
                 if insert_text_with_fallbacks(page, task['bbox'], task['translated'], task['font_info']):
@@ -592,6 +889,12 @@ def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, t
             print(f"   Error processing page {page_num + 1}: {e}")
             traceback.print_exc()
 
+def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
+    doc = fitz.open(input_pdf_path)
+    print(f"🔄 Starting layout-preserving translation of {len(doc)} pages to {target_lang}")
+
+    asyncio.run(translate_document(doc, target_lang))
+
     # Save the document
     doc.save(output_pdf_path)
     doc.close()
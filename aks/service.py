@@ -1,10 +1,14 @@
-import os, time, json, uuid, re, logging,datetime
+import os, time, uuid, re, logging,datetime, threading
+from concurrent.futures import ThreadPoolExecutor
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import SearchIndex, SimpleField, SearchFieldDataType
 from azure.core.credentials import AzureKeyCredential
-from bs4 import BeautifulSoup
-from azure.storage.fileshare import ShareDirectoryClient, ShareFileClient, generate_file_sas, FileSasPermissions
+from selectolax.parser import HTMLParser
+import json5
+import orjson
+from azure.storage.fileshare import ShareClient, generate_file_sas, FileSasPermissions
+from azure.storage.queue import QueueClient
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -18,10 +22,31 @@ STORAGE_CONN_STRING = os.environ["STORAGE_CONN_STRING"]
 FILESHARE_NAME = os.environ["FILESHARE_NAME"]
 DIRECTORY_PATH = os.environ.get("DIRECTORY_PATH", "")  # subdir or root
 POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "60"))  # seconds
+# Storage queue that receives one message (the file name) per new report;
+# when unset the service falls back to polling the directory
+QUEUE_NAME = os.environ.get("QUEUE_NAME")
+QUEUE_IDLE_SLEEP = int(os.environ.get("QUEUE_IDLE_SLEEP", "5"))  # seconds
+WORKERS = int(os.environ.get("WORKERS", "16"))  # files downloaded/moved in parallel
 
-processed_files = set()  # to avoid reprocessing
+processed_ids = set()  # document ids already in the index, reloaded on startup
+processed_lock = threading.Lock()
 ERROR_FOLDER = "error" 
 PROCESSED_FOLDER = "processed"
+INDEX_BATCH_SIZE = 1000  # Azure Search accepts up to 1000 documents per upload
+COPY_RANGE_SIZE = 4 * 1024 * 1024  # largest range a single upload_range accepts
+LIST_PAGE_SIZE = 5000  # entries per directory listing request
+
+TIMESTAMP_RE = re.compile(r"Report generated on (.*?) by")
+
+# Repairs applied to the JSON blob only when json5 cannot read it
+UNQUOTED_KEY_RE = re.compile(r'([{,]\s*)([A-Za-z0-9_]+)\s*:')
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+# Shared clients so every file and document reuses the same HTTPS connection pool
+share_client = ShareClient.from_connection_string(STORAGE_CONN_STRING, share_name=FILESHARE_NAME)
+search_client = SearchClient(endpoint=SEARCH_ENDPOINT,
+                             index_name=INDEX_NAME,
+                             credential=AzureKeyCredential(SEARCH_KEY))
 
 def ensure_index():
     index_client = SearchIndexClient(endpoint=SEARCH_ENDPOINT,
@@ -43,45 +68,63 @@ def ensure_index():
         index_client.create_index(index)
         logging.info(f"Created index '{INDEX_NAME}'.")
         
-def parse_html(content: str):
-    soup = BeautifulSoup(content, "html.parser")
+def document_id(name, etag):
+    """Stable id per file version, so re-processing a file overwrites its document."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{FILESHARE_NAME}/{name}|{etag}"))
+
+def load_processed_ids():
+    """Rebuild the dedup set from the ids already in the index."""
+    for result in search_client.search(search_text="*", select=["id"]):
+        processed_ids.add(result["id"])
+    logging.info(f"Loaded {len(processed_ids)} indexed document ids.")
+
+def parse_html(content: str, doc_id=None):
+    tree = HTMLParser(content)
 
     # Extract timestamp
     timestamp = ""
-    p_tag = soup.find("p")
+    p_tag = tree.css_first("p")
     if p_tag:
-        match = re.search(r"Report generated on (.*?) by", p_tag.get_text())
+        match = TIMESTAMP_RE.search(p_tag.text())
         if match:
             timestamp = match.group(1)
 
     # Extract JSON environment
-    json_blob = soup.find("div", {"id": "data-container"})
+    json_blob = tree.css_first("div#data-container")
     env_data = {}
     if json_blob:
-        raw = json_blob.get("data-jsonblob", "")
+        raw = json_blob.attributes.get("data-jsonblob") or ""
 
-        # Fix common issues:
-        # 1. Replace single quotes with double quotes
-        raw = raw.replace("'", '"')
+        # Well-formed blobs parse directly; json5 accepts single quotes, unquoted keys
+        # and trailing commas, but is much slower, so it only sees what orjson rejects
+        try:
+            env_data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            try:
+                env_data = json5.loads(raw)
+            except Exception:
+                # Fix common issues:
+                # 1. Replace single quotes with double quotes
+                raw = raw.replace("'", '"')
 
-        # 2. Ensure keys are quoted
-        raw = re.sub(r'([{,]\s*)([A-Za-z0-9_]+)\s*:', r'\1"\2":', raw)
+                # 2. Ensure keys are quoted
+                raw = UNQUOTED_KEY_RE.sub(r'\1"\2":', raw)
 
-        # 3. Remove trailing commas
-        raw = re.sub(r',\s*([}\]])', r'\1', raw)
+                # 3. Remove trailing commas
+                raw = TRAILING_COMMA_RE.sub(r'\1', raw)
 
-        # 4. Remove newlines and excessive spaces
-        raw = raw.strip().replace("\n", " ")
+                # 4. Remove newlines and excessive spaces
+                raw = raw.strip().replace("\n", " ")
 
-        try:
-            env_data = json.loads(raw)
-        except Exception as e:
-            logging.error(f"Failed to parse JSON blob after cleanup: {e}")
-            logging.error(f"Raw JSON (post-cleanup): {raw}")
+                try:
+                    env_data = orjson.loads(raw)
+                except orjson.JSONDecodeError as e:
+                    logging.error(f"Failed to parse JSON blob after cleanup: {e}")
+                    logging.error(f"Raw JSON (post-cleanup): {raw}")
 
     env = env_data.get("environment", {}) if env_data else {}
     return {
-        "id": str(uuid.uuid4()),
+        "id": doc_id or str(uuid.uuid4()),
         "timestamp": timestamp,
         "python_version": env.get("Python"),
         "platform": env.get("Platform"),
@@ -91,41 +134,80 @@ def parse_html(content: str):
     }
 
 
-def index_document(doc):
-    client = SearchClient(endpoint=SEARCH_ENDPOINT,
-                          index_name=INDEX_NAME,
-                          credential=AzureKeyCredential(SEARCH_KEY))
-    client.upload_documents([doc])
-    logging.info(f"Indexed document ID: {doc['id']}")
+def index_documents(docs):
+    """Upload documents in batches; returns the ids that were indexed."""
+    indexed = set()
+    for start in range(0, len(docs), INDEX_BATCH_SIZE):
+        batch = docs[start:start + INDEX_BATCH_SIZE]
+        try:
+            results = search_client.upload_documents(batch)
+        except Exception as e:
+            logging.error(f"Failed to index batch of {len(batch)} documents: {e}")
+            continue
+        for result in results:
+            if result.succeeded:
+                indexed.add(result.key)
+            else:
+                logging.error(f"Failed to index document ID {result.key}: {result.error_message}")
+    logging.info(f"Indexed {len(indexed)}/{len(docs)} documents")
+    return indexed
+
+def stream_copy(src_client, dest_client):
+    """Copy a file through the worker in 4 MiB ranges, without holding it all in memory."""
+    size = src_client.get_file_properties().size
+    dest_client.create_file(size)
+    offset = 0
+    buffer = bytearray()
+    for chunk in src_client.download_file(max_concurrency=8).chunks():
+        buffer += chunk
+        while len(buffer) >= COPY_RANGE_SIZE:
+            dest_client.upload_range(bytes(buffer[:COPY_RANGE_SIZE]), offset=offset, length=COPY_RANGE_SIZE)
+            offset += COPY_RANGE_SIZE
+            del buffer[:COPY_RANGE_SIZE]
+    if buffer:
+        dest_client.upload_range(bytes(buffer), offset=offset, length=len(buffer))
+
 
 def move_file(file_name, target_folder):
-    """Move file to a target folder (processed/ or error/) without SAS."""
+    """Move file to a target folder (processed/ or error/) with a server-side copy."""
     try:
         src_path = f"{DIRECTORY_PATH}/{file_name}" if DIRECTORY_PATH else file_name
         dest_path = f"{target_folder}/{file_name}"
 
         # Ensure target directory exists
-        target_dir_client = ShareDirectoryClient.from_connection_string(
-            STORAGE_CONN_STRING, share_name=FILESHARE_NAME, directory_path=target_folder
-        )
+        target_dir_client = share_client.get_directory_client(target_folder)
         try:
             target_dir_client.create_directory()
         except:
             pass  # folder already exists
 
         # Clients
-        src_client = ShareFileClient.from_connection_string(
-            STORAGE_CONN_STRING, share_name=FILESHARE_NAME, file_path=src_path
-        )
-        dest_client = ShareFileClient.from_connection_string(
-            STORAGE_CONN_STRING, share_name=FILESHARE_NAME, file_path=dest_path
-        )
+        src_client = share_client.get_file_client(src_path)
+        dest_client = share_client.get_file_client(dest_path)
 
-        # Download file content
-        content = src_client.download_file().readall()
+        try:
+            # Short-lived read SAS so the service can copy the bytes itself
+            sas = generate_file_sas(
+                account_name=share_client.account_name,
+                share_name=FILESHARE_NAME,
+                file_path=src_path.split("/"),
+                account_key=share_client.credential.account_key,
+                permission=FileSasPermissions(read=True),
+                expiry=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5),
+            )
+            dest_client.start_copy_from_url(f"{src_client.url}?{sas}")
 
-        # Upload to destination
-        dest_client.upload_file(content)
+            # Wait for the copy to land before deleting the source
+            copy = dest_client.get_file_properties().copy
+            while copy.status == "pending":
+                time.sleep(1)
+                copy = dest_client.get_file_properties().copy
+            if copy.status != "success":
+                raise RuntimeError(f"copy ended with status '{copy.status}': {copy.status_description}")
+        except Exception as e:
+            # Fall back to streaming the bytes through the worker
+            logging.warning(f"Server-side copy of '{file_name}' failed, streaming instead: {e}")
+            stream_copy(src_client, dest_client)
 
         # Delete original
         src_client.delete_file()
@@ -135,36 +217,88 @@ def move_file(file_name, target_folder):
         logging.error(f"Failed to move '{file_name}' to '{target_folder}/': {e}")
 
 
-def process_files():
-    dir_client = ShareDirectoryClient.from_connection_string(
-        STORAGE_CONN_STRING, share_name=FILESHARE_NAME, directory_path=DIRECTORY_PATH
-    )
-    for item in dir_client.list_directories_and_files():
-        name = item["name"]
-        if not name.endswith(".html") or name in processed_files:
-            continue
-
-        logging.info(f"Processing file: {name}")
-        try:
-            file_client = ShareFileClient.from_connection_string(
-                STORAGE_CONN_STRING, share_name=FILESHARE_NAME, file_path=name
-            )
-            content = file_client.download_file().readall().decode("utf-8")
-            doc = parse_html(content)
-            index_document(doc)  # Your Azure Search ingestion
-            processed_files.add(name)
+def list_new_files():
+    """Directory listing used when no queue is configured: [(name, etag)]."""
+    dir_client = share_client.get_directory_client(DIRECTORY_PATH)
+    pages = dir_client.list_directories_and_files(include=["Etag"], results_per_page=LIST_PAGE_SIZE).by_page()
+    return [(item["name"], item.get("etag"))
+            for page in pages
+            for item in page
+            if item["name"].endswith(".html") and not item.get("is_directory")]
 
-            # Move to processed folder after success
+def prepare_file(name, etag):
+    """Download and parse one file; returns (name, document) or None if there is nothing to index."""
+    logging.info(f"Processing file: {name}")
+    try:
+        file_client = share_client.get_file_client(name)
+        if etag is None:
+            etag = file_client.get_file_properties().etag
+        doc_id = document_id(name, etag)
+        with processed_lock:
+            already_indexed = doc_id in processed_ids
+        if already_indexed:
+            # Indexed by an earlier run that stopped before moving it
             move_file(name, PROCESSED_FOLDER)
+            return None
+        content = file_client.download_file().readall().decode("utf-8")
+        return name, parse_html(content, doc_id)
+    except Exception as e:
+        logging.error(f"Error processing '{name}': {e}")
+        move_file(name, ERROR_FOLDER)
+        return None
 
-        except Exception as e:
-            logging.error(f"Error processing '{name}': {e}")
-            move_file(name, ERROR_FOLDER)
+
+def process_files(files=None):
+    """Process (name, etag) pairs, or the whole directory when files is None."""
+    if files is None:
+        files = list_new_files()
+    files = [(name, etag) for name, etag in files if name.endswith(".html")]
+    if not files:
+        return
+
+    # Downloads and moves are network-bound, so run them across threads
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = executor.map(lambda f: prepare_file(*f), files)
+        pending = [result for result in results if result]  # (file name, parsed document)
+        if not pending:
+            return
+
+        # One upload for the whole polling cycle
+        indexed = index_documents([doc for _, doc in pending])
+        with processed_lock:
+            processed_ids.update(doc["id"] for _, doc in pending if doc["id"] in indexed)
+
+        # Move to processed folder after success
+        moves = [(name, PROCESSED_FOLDER if doc["id"] in indexed else ERROR_FOLDER) for name, doc in pending]
+        list(executor.map(lambda m: move_file(*m), moves))
+
+
+def consume_queue():
+    """Process files as their names arrive on the storage queue."""
+    queue_client = QueueClient.from_connection_string(STORAGE_CONN_STRING, QUEUE_NAME)
+    while True:
+        messages = list(queue_client.receive_messages(max_messages=32, visibility_timeout=300))
+        if not messages:
+            time.sleep(QUEUE_IDLE_SLEEP)
+            continue
+        process_files([(message.content.strip(), None) for message in messages])
+        # Unhandled failures leave the messages to reappear after the visibility timeout
+        for message in messages:
+            # A pop receipt that expired during a long batch must not stop the consumer;
+            # the message then reappears and its already indexed file is skipped
+            try:
+                queue_client.delete_message(message)
+            except Exception as e:
+                logging.error(f"Failed to delete message {message.id}: {e}")
 
 
 if __name__ == "__main__":
     logging.info("Starting File Processor Service")
     ensure_index()  # assumes this exists
-    while True:
-        process_files()
-        time.sleep(POLL_INTERVAL)
+    load_processed_ids()
+    if QUEUE_NAME:
+        consume_queue()
+    else:
+        while True:
+            process_files()
+            time.sleep(POLL_INTERVAL)
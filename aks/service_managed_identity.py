@@ -1,11 +1,17 @@
-import os, time, json, uuid, re, logging
+import os, time, uuid, re, logging
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import SearchIndex, SimpleField, SearchFieldDataType
 from azure.core.credentials import AzureKeyCredential
-from bs4 import BeautifulSoup
+from azure.core.exceptions import ResourceNotFoundError
+from selectolax.parser import HTMLParser
+import orjson
 from azure.storage.fileshare import ShareServiceClient, ShareDirectoryClient, ShareFileClient
 from azure.identity import DefaultAzureCredential
+from azure.servicebus import ServiceBusClient
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -18,18 +24,46 @@ STORAGE_ACCOUNT = os.environ["STORAGE_ACCOUNT"]       # e.g., "teststorage123409
 FILESHARE_NAME = os.environ["FILESHARE_NAME"]        # e.g., "file-search"
 DIRECTORY_PATH = os.environ.get("DIRECTORY_PATH", "")  # subdir or root
 POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "60"))  # seconds
+SERVICEBUS_NAMESPACE = os.environ.get("SERVICEBUS_NAMESPACE")  # e.g., "testbus.servicebus.windows.net"; unset = polling
+SERVICEBUS_QUEUE = os.environ.get("SERVICEBUS_QUEUE", "file-events")
+
+HTTP_POOL_SIZE = 64  # pooled connections per host, shared by every SDK client
+CONNECTION_TIMEOUT = 10  # seconds
+READ_TIMEOUT = 120  # seconds
+
+# One requests session (and connection pool) behind all Azure clients, so TLS handshakes are reused
+http_session = requests.Session()
+http_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+http_session.mount("https://", http_adapter)
+transport = RequestsTransport(session=http_session, session_owner=False,
+                              connection_timeout=CONNECTION_TIMEOUT, read_timeout=READ_TIMEOUT)
 
 # Create service client with Managed Identity
 credential = DefaultAzureCredential()
-service_client = ShareServiceClient(account_url=f"https://{STORAGE_ACCOUNT}.file.core.windows.net", credential=credential)
+service_client = ShareServiceClient(account_url=f"https://{STORAGE_ACCOUNT}.file.core.windows.net",
+                                    credential=credential, transport=transport)
+share_client = service_client.get_share_client(FILESHARE_NAME)
+
+# Reused for every upload so the HTTPS connection stays open
+search_client = SearchClient(endpoint=SEARCH_ENDPOINT, index_name=INDEX_NAME,
+                             credential=AzureKeyCredential(SEARCH_KEY), transport=transport)
 
 processed_files = set()
 ERROR_FOLDER = "error"
 PROCESSED_FOLDER = "processed"
+INDEX_BATCH_SIZE = 1000  # Azure Search accepts up to 1000 documents per upload
+COPY_RANGE_SIZE = 4 * 1024 * 1024  # largest range a single upload_range accepts
+LIST_PAGE_SIZE = 5000  # entries per directory listing request
+
+# Patterns used by parse_html, compiled once
+TIMESTAMP_RE = re.compile(r"Report generated on (.*?) by")
+UNQUOTED_KEY_RE = re.compile(r'([{,]\s*)([A-Za-z0-9_]+)\s*:')
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
 
 
 def ensure_index():
-    index_client = SearchIndexClient(endpoint=SEARCH_ENDPOINT, credential=AzureKeyCredential(SEARCH_KEY))
+    index_client = SearchIndexClient(endpoint=SEARCH_ENDPOINT, credential=AzureKeyCredential(SEARCH_KEY),
+                                     transport=transport)
     try:
         index_client.get_index(INDEX_NAME)
         logging.info(f"Index '{INDEX_NAME}' exists.")
@@ -49,27 +83,31 @@ def ensure_index():
 
 
 def parse_html(content: str):
-    soup = BeautifulSoup(content, "html.parser")
+    tree = HTMLParser(content)
     timestamp = ""
-    p_tag = soup.find("p")
+    p_tag = tree.css_first("p")
     if p_tag:
-        match = re.search(r"Report generated on (.*?) by", p_tag.get_text())
+        match = TIMESTAMP_RE.search(p_tag.text())
         if match:
             timestamp = match.group(1)
 
-    json_blob = soup.find("div", {"id": "data-container"})
+    json_blob = tree.css_first("div#data-container")
     env_data = {}
     if json_blob:
-        raw = json_blob.get("data-jsonblob", "")
-        raw = raw.replace("'", '"')
-        raw = re.sub(r'([{,]\s*)([A-Za-z0-9_]+)\s*:', r'\1"\2":', raw)
-        raw = re.sub(r',\s*([}\]])', r'\1', raw)
-        raw = raw.strip().replace("\n", " ")
+        raw = json_blob.attributes.get("data-jsonblob") or ""
         try:
-            env_data = json.loads(raw)
-        except Exception as e:
-            logging.error(f"Failed to parse JSON blob after cleanup: {e}")
-            logging.error(f"Raw JSON (post-cleanup): {raw}")
+            env_data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Only malformed blobs pay for the cleanup passes
+            raw = raw.replace("'", '"')
+            raw = UNQUOTED_KEY_RE.sub(r'\1"\2":', raw)
+            raw = TRAILING_COMMA_RE.sub(r'\1', raw)
+            raw = raw.strip().replace("\n", " ")
+            try:
+                env_data = orjson.loads(raw)
+            except orjson.JSONDecodeError as e:
+                logging.error(f"Failed to parse JSON blob after cleanup: {e}")
+                logging.error(f"Raw JSON (post-cleanup): {raw}")
 
     env = env_data.get("environment", {}) if env_data else {}
     return {
@@ -83,22 +121,48 @@ def parse_html(content: str):
     }
 
 
-def index_document(doc):
-    client = SearchClient(endpoint=SEARCH_ENDPOINT, index_name=INDEX_NAME, credential=AzureKeyCredential(SEARCH_KEY))
-    client.upload_documents([doc])
-    logging.info(f"Indexed document ID: {doc['id']}")
+def index_documents(docs):
+    """Upload documents in batches; returns the ids that were indexed."""
+    indexed = set()
+    for start in range(0, len(docs), INDEX_BATCH_SIZE):
+        batch = docs[start:start + INDEX_BATCH_SIZE]
+        try:
+            results = search_client.upload_documents(batch)
+        except Exception as e:
+            logging.error(f"Failed to index batch of {len(batch)} documents: {e}")
+            continue
+        for result in results:
+            if result.succeeded:
+                indexed.add(result.key)
+            else:
+                logging.error(f"Failed to index document ID {result.key}: {result.error_message}")
+    logging.info(f"Indexed {len(indexed)}/{len(docs)} documents: {sorted(indexed)}")
+    return indexed
 
 
-def get_directory_client(path=""):
-    return service_client.get_share_client(FILESHARE_NAME).get_directory_client(path)
+# Derived from the shared share client, so they inherit its pipeline
+get_directory_client = share_client.get_directory_client
+get_file_client = share_client.get_file_client
 
 
-def get_file_client(path):
-    return service_client.get_share_client(FILESHARE_NAME).get_file_client(path)
+def stream_copy(src_client, dest_client):
+    """Copy a file through the worker in 4 MiB ranges, without holding it all in memory."""
+    size = src_client.get_file_properties().size
+    dest_client.create_file(size)
+    offset = 0
+    buffer = bytearray()
+    for chunk in src_client.download_file(max_concurrency=8).chunks():
+        buffer += chunk
+        while len(buffer) >= COPY_RANGE_SIZE:
+            dest_client.upload_range(bytes(buffer[:COPY_RANGE_SIZE]), offset=offset, length=COPY_RANGE_SIZE)
+            offset += COPY_RANGE_SIZE
+            del buffer[:COPY_RANGE_SIZE]
+    if buffer:
+        dest_client.upload_range(bytes(buffer), offset=offset, length=len(buffer))
 
 
 def move_file(file_name, target_folder):
-    """Move file by reading -> uploading -> deleting (no SAS)."""
+    """Move file with a server-side copy, then delete the source (no SAS)."""
     try:
         src_path = f"{DIRECTORY_PATH}/{file_name}" if DIRECTORY_PATH else file_name
         dest_path = f"{target_folder}/{file_name}"
@@ -114,9 +178,20 @@ def move_file(file_name, target_folder):
         src_client = get_file_client(src_path)
         dest_client = get_file_client(dest_path)
 
-        # Copy by downloading and re-uploading
-        content = src_client.download_file().readall()
-        dest_client.upload_file(content)
+        try:
+            # Same-account copy inside the storage service, authorized by the managed identity
+            dest_client.start_copy_from_url(src_client.url)
+            copy = dest_client.get_file_properties().copy
+            while copy.status == "pending":
+                time.sleep(1)
+                copy = dest_client.get_file_properties().copy
+            if copy.status != "success":
+                raise RuntimeError(f"copy ended with status '{copy.status}': {copy.status_description}")
+        except Exception as e:
+            # Fall back to streaming the bytes through the worker
+            logging.warning(f"Server-side copy of '{file_name}' failed, streaming instead: {e}")
+            stream_copy(src_client, dest_client)
+
         src_client.delete_file()
 
         logging.info(f"Moved '{file_name}' to '{target_folder}/'.")
@@ -124,29 +199,136 @@ def move_file(file_name, target_folder):
         logging.error(f"Failed to move '{file_name}' to '{target_folder}/': {e}")
 
 
-def process_files():
-    dir_client = get_directory_client(DIRECTORY_PATH)
-    for item in dir_client.list_directories_and_files():
-        name = item["name"]
-        if not name.endswith(".html") or name in processed_files:
-            continue
+def already_processed(name):
+    """
+    A copy in processed/ means an earlier run (possibly before a restart) handled this file,
+    unless the source was written after that copy was made (e.g. a corrected re-upload).
+    A source left behind by a move interrupted before its delete is removed, so it is not checked again.
+    """
+    if name in processed_files:
+        return True
+    try:
+        processed = get_file_client(f"{PROCESSED_FOLDER}/{name}").get_file_properties()
+    except ResourceNotFoundError:
+        return False
+    src_client = get_file_client(f"{DIRECTORY_PATH}/{name}" if DIRECTORY_PATH else name)
+    try:
+        source = src_client.get_file_properties()
+    except ResourceNotFoundError:
+        processed_files.add(name)
+        return True
+    if source.size != processed.size or source.last_modified > processed.last_modified:
+        # New content under the same name: process it again (its move replaces the old copy)
+        return False
+    processed_files.add(name)
+    try:
+        src_client.delete_file()
+        logging.info(f"Removed '{name}', already in '{PROCESSED_FOLDER}/'.")
+    except ResourceNotFoundError:
+        pass
+    return True
 
-        logging.info(f"Processing file: {name}")
-        try:
-            file_client = get_file_client(name)
-            content = file_client.download_file().readall().decode("utf-8")
-            doc = parse_html(content)
-            index_document(doc)
+
+def load_document(name):
+    """Download and parse one file; failures are moved to the error folder and return None."""
+    logging.info(f"Processing file: {name}")
+    try:
+        file_client = get_file_client(name)
+        content = file_client.download_file().readall().decode("utf-8")
+        return parse_html(content)
+    except Exception as e:
+        logging.error(f"Error processing '{name}': {e}")
+        move_file(name, ERROR_FOLDER)
+        return None
+
+
+def finish_files(pending):
+    """Index (file name, document) pairs in one upload, then move each file by outcome."""
+    if not pending:
+        return
+    indexed = index_documents([doc for _, doc in pending])
+    for name, doc in pending:
+        if doc["id"] in indexed:
             processed_files.add(name)
             move_file(name, PROCESSED_FOLDER)
-        except Exception as e:
-            logging.error(f"Error processing '{name}': {e}")
+        else:
             move_file(name, ERROR_FOLDER)
 
 
+def process_one(name):
+    if not name.endswith(".html") or already_processed(name):
+        return
+    doc = load_document(name)
+    if doc is not None:
+        finish_files([(name, doc)])
+
+
+def process_files():
+    dir_client = get_directory_client(DIRECTORY_PATH)
+    pending = []  # (file name, parsed document) waiting to be indexed
+    pages = dir_client.list_directories_and_files(results_per_page=LIST_PAGE_SIZE).by_page()
+    names = (item["name"] for page in pages for item in page if item["name"].endswith(".html"))
+    for name in names:
+        try:
+            if already_processed(name):
+                continue
+        except Exception as e:
+            # Left in place and checked again on the next poll
+            logging.error(f"Failed to check '{name}': {e}")
+            continue
+        doc = load_document(name)
+        if doc is not None:
+            pending.append((name, doc))
+
+    # One upload for the whole polling cycle
+    finish_files(pending)
+
+
+def message_file_name(message):
+    """File name from a Service Bus message: an Event Grid event (subject/url) or a bare name."""
+    body = str(message).strip()
+    try:
+        event = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return body
+    if isinstance(event, list):  # Event Grid may deliver a batch of one
+        event = event[0] if event else {}
+    if not isinstance(event, dict):
+        return str(event)
+    path = event.get("data", {}).get("url") or event.get("subject") or event.get("name") or ""
+    return path.rstrip("/").rsplit("/", 1)[-1]
+
+
+def consume_service_bus():
+    """Process files as their creation events arrive on the Service Bus queue."""
+    with ServiceBusClient(SERVICEBUS_NAMESPACE, credential=credential) as bus_client:
+        with bus_client.get_queue_receiver(SERVICEBUS_QUEUE) as receiver:
+            for message in receiver:
+                try:
+                    process_one(message_file_name(message))
+                    handled = True
+                except Exception as e:
+                    logging.error(f"Failed to handle message {message.message_id}: {e}")
+                    handled = False
+                # A lost lock or dropped link must not stop the consumer; an unsettled
+                # message is redelivered once its lock expires
+                try:
+                    if handled:
+                        receiver.complete_message(message)
+                    else:
+                        receiver.abandon_message(message)
+                except Exception as e:
+                    logging.error(f"Failed to settle message {message.message_id}: {e}")
+
+
 if __name__ == "__main__":
     logging.info("Starting File Processor Service")
     ensure_index()
-    while True:
-        process_files()
-        time.sleep(POLL_INTERVAL)
+    # Catch up on anything that arrived while the service was down
+    process_files()
+    if SERVICEBUS_NAMESPACE:
+        consume_service_bus()
+    else:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            process_files()
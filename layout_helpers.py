@@ -0,0 +1,137 @@
+"""
+Per-span helpers shared by the layout-preserving translator.
+
+Kept free of dynamic features so the module can be compiled with mypyc:
+
+    pip install mypy
+    mypyc layout_helpers.py
+
+The compiled extension is picked up by a plain `import layout_helpers`;
+without it the pure-Python module is used unchanged.
+"""
+import functools
+import math
+import re
+from typing import Any, Dict, Final, FrozenSet, Pattern, Tuple
+
+import fitz  # PyMuPDF
+
+# Patterns for text that should never be translated
+NUM_RE: Final[Pattern[str]] = re.compile(r'^\d+$')
+MONEY_RE: Final[Pattern[str]] = re.compile(r'^\$\d+([,\d]*\.?\d*)?$')
+CODE_RE: Final[Pattern[str]] = re.compile(r'^[A-Z0-9]{3,}$')
+ABBREVIATIONS: Final[FrozenSet[str]] = frozenset({'N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC'})
+
+# Helvetica metrics, loaded once
+HELV: Final = fitz.Font('helv')
+HELV_BOLD: Final = fitz.Font('hebo')
+
+
+def should_translate_text(text: str) -> bool:
+    """
+    Determine if text should be translated - be more conservative to preserve layout.
+    """
+    text = text.strip()
+    
+    if not text:
+        return False
+    
+    # Don't translate pure numbers
+    if NUM_RE.match(text):
+        return False
+    
+    # Don't translate currency amounts
+    if MONEY_RE.match(text):
+        return False
+    
+    # Don't translate codes/IDs
+    if CODE_RE.match(text):
+        return False
+    
+    # Don't translate single characters or very short strings
+    if len(text) <= 2:
+        return False
+    
+    # Don't translate abbreviations
+    if text.upper() in ABBREVIATIONS:
+        return False
+    
+    # Don't translate if it's mostly numbers and special characters
+    alpha_chars = 0
+    for c in text:
+        if c.isalpha():
+            alpha_chars += 1
+            if alpha_chars >= 3:
+                return True
+    
+    return False
+
+
+def is_protected_value(text: str) -> bool:
+    """
+    True for numbers, amounts and codes, which are always kept verbatim.
+    """
+    text = text.strip()
+    return bool(NUM_RE.match(text) or MONEY_RE.match(text) or CODE_RE.match(text))
+
+
+def get_font_info(font_name: str, flags: int, size: float, color: int) -> Dict[str, Any]:
+    """
+    Build font information with better defaults and available fonts.
+    """
+    font_name = font_name.lower()
+    
+    # Determine font type
+    is_bold = 'bold' in font_name or bool(flags & 16)
+    is_italic = 'italic' in font_name or bool(flags & 2)
+    
+    # Use the Base-14 Helvetica variants, which are always available; PyMuPDF only
+    # knows them by their short names (hebo, heit, hebi)
+    if is_bold and is_italic:
+        font = "hebi"
+    elif is_bold:
+        font = "hebo"
+    elif is_italic:
+        font = "heit"
+    else:
+        font = "helv"
+    
+    return {
+        'font': font,
+        'size': max(6.0, min(size, 24.0)),  # Reasonable size limits
+        'color': color,
+        'flags': flags
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def calculate_text_dimensions(text: str, font_size: float, bold: bool = False) -> Tuple[float, float]:
+    """
+    Calculate text dimensions from real Helvetica glyph widths.
+    """
+    font = HELV_BOLD if bold else HELV
+    text_width: float = font.text_length(text, fontsize=font_size)
+    text_height = font_size * 1.2  # Include some line spacing
+    
+    return text_width, text_height
+
+
+@functools.lru_cache(maxsize=None)
+def font_line_height(fontname: str) -> float:
+    """
+    Line height of a font as a multiple of its size, as insert_textbox lays lines out.
+    """
+    font = fitz.Font(fontname)
+    line_height: float = font.ascender - font.descender
+    return line_height
+
+
+def text_fits(rect: fitz.Rect, text: str, fontname: str, size: float) -> bool:
+    """
+    Predict whether text wraps into rect at the given size, from its measured width.
+    """
+    if rect.width <= 0:
+        return False
+    text_width: float = fitz.get_text_length(text, fontname=fontname, fontsize=size)
+    lines = max(1, math.ceil(text_width / rect.width))
+    return lines * size * font_line_height(fontname) <= rect.height
@@ -1,46 +1,107 @@
+import asyncio
 import fitz  # PyMuPDF
-from openai import OpenAI
-import time
-from collections import Counter
+from openai import AsyncOpenAI, APIConnectionError, OpenAIError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from collections import Counter, OrderedDict
 import traceback
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
 
-client = OpenAI(api_key="test")
+# Retries are handled by request_completion below, not by the SDK
+client = AsyncOpenAI(api_key="test", max_retries=0)
 
-def translate_text(text, target_lang="Spanish", retries=3):
+# Requests allowed in flight at once, to stay under the rate limit
+MAX_CONCURRENT_REQUESTS = 8
+request_semaphore = None  # created inside the running event loop
+
+backoff = wait_random_exponential(min=1, max=30)
+# Longest Retry-After honoured, so one bad header cannot stall a worker
+MAX_RETRY_AFTER = 60
+
+def wait_retry_after(retry_state):
+    """Wait as long as the server's Retry-After asks (up to a cap), else exponential backoff with jitter."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None:
+        try:
+            return min(max(float(response.headers.get("retry-after")), 0), MAX_RETRY_AFTER)
+        except (TypeError, ValueError):
+            pass
+    return backoff(retry_state)
+
+# Only rate limits and dropped connections are worth retrying
+@retry(wait=wait_retry_after, stop=stop_after_attempt(6),
+       retry=retry_if_exception_type((RateLimitError, APIConnectionError)), reraise=True)
+async def request_completion(prompt):
+    async with request_semaphore:
+        response = await client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+        )
+    return response.choices[0].message.content
+
+async def translate_text(text, target_lang="Spanish"):
     if not text.strip():
         return text
     prompt = f"Translate the following English text to {target_lang}, preserving format and tone. Only return the translation:\n\n{text}"
-    for attempt in range(retries):
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Retrying translation due to error: {e}")
-            time.sleep(2 ** attempt)
-    return text  # fallback
+    try:
+        return (await request_completion(prompt)).strip()
+    except OpenAIError as e:
+        print(f"Translation failed: {e}")
+        return text  # fallback
+
+# Spans sent per batched request, and the "N. text" lines the reply is parsed from
+BATCH_SIZE = 40
+NUMBERED_LINE_RE = re.compile(r'^\s*(\d+)\.\s*(.*)$', re.M)
+
+async def translate_chunk(texts, target_lang="Spanish"):
+    """Translate a list of texts with one numbered-list request; returns {text: translation}."""
+    numbered = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+    prompt = (f"Translate each numbered English line to {target_lang}, preserving format and tone. "
+              f"Return the same numbering, one line per item, and only the translations:\n\n{numbered}")
+    translations = {}
+    try:
+        for number, line in NUMBERED_LINE_RE.findall(await request_completion(prompt)):
+            index = int(number) - 1
+            if 0 <= index < len(texts) and line.strip():
+                translations[texts[index]] = line.strip()
+    except OpenAIError as e:
+        print(f"Batch translation of {len(texts)} texts failed: {e}")
+
+    # Anything the reply skipped or mangled is retried in two smaller batches, so a
+    # failed batch costs a few requests rather than one per text
+    missing = [text for text in texts if text not in translations]
+    if len(missing) <= 2:
+        results = await asyncio.gather(*[translate_text(text, target_lang) for text in missing])
+        translations.update(zip(missing, results))
+    else:
+        half = len(missing) // 2
+        for part in await asyncio.gather(translate_chunk(missing[:half], target_lang),
+                                         translate_chunk(missing[half:], target_lang)):
+            translations.update(part)
+    return translations
+
+FONT_MAP = {
+    'bold': 'helv-bold',
+    'light': 'helv',
+    'regular': 'helv'
+}
 
 def get_font_type(span):
     font_name = span.get('font', '').lower()
     flags = span.get('flags', 0)
-    if 'bold' in font_name or flags == 20:
+    if flags & 16 or 'bold' in font_name:
         return 'bold'
-    elif 'light' in font_name or flags == 4:
+    elif flags == 4 or 'light' in font_name:
         return 'light'
     else:
         return 'regular'
 
 def get_pymupdf_font(font_type):
-    font_map = {
-        'bold': 'helv-bold',
-        'light': 'helv',
-        'regular': 'helv'
-    }
-    return font_map.get(font_type, 'helv')
+    return FONT_MAP.get(font_type, 'helv')
 
 def convert_color_to_rgb(color_value):
     if isinstance(color_value, (int, float)):
@@ -58,112 +119,207 @@ def convert_color_to_rgb(color_value):
     else:
         return (0, 0, 0)
 
-def translate_pdf(input_pdf_path, output_pdf_path, target_lang="Spanish"):
-    doc = fitz.open(input_pdf_path)
-    total_pages = len(doc)
+def extract_text_elements(page):
+    blocks = page.get_text("dict")["blocks"]
+    text_elements = []
+
+    for block_no, block in enumerate(blocks):
+        if "lines" in block:
+            for line_no, line in enumerate(block["lines"]):
+                for span in line["spans"]:
+                    original_text = span["text"].strip()
+                    if original_text:
+                        font_type = get_font_type(span)
+                        bbox = span["bbox"]
+                        text_elements.append({
+                            'text': original_text,
+                            'bbox': bbox,
+                            'size': span["size"],
+                            'flags': span.get("flags", 0),
+                            'font_type': font_type,
+                            'pymupdf_font': get_pymupdf_font(font_type),
+                            'original_font': span.get('font', ''),
+                            'origin': span.get("origin", (bbox[0], bbox[3] - 2)),
+                            'rotation': span.get("text_angle", 0),
+                            'color': span.get('color', 0),
+                            'line': (block_no, line_no)
+                        })
+    return text_elements
+
+# (text, target_lang) -> translation, kept for the life of the process (least recently used first)
+TRANSLATION_CACHE_SIZE = 8192
+translation_cache = OrderedDict()
+
+async def translate_all(texts, target_lang="Spanish"):
+    """Translate unique texts in numbered batches, all batches in flight together.
+    Texts translated earlier in this process are served from translation_cache."""
+    global request_semaphore
+    request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    translations = {}
+    misses = []
+    for text in texts:
+        key = (text, target_lang)
+        if key in translation_cache:
+            translation_cache.move_to_end(key)
+            translations[text] = translation_cache[key]
+        else:
+            misses.append(text)
+
+    chunks = [misses[start:start + BATCH_SIZE] for start in range(0, len(misses), BATCH_SIZE)]
+    for result in await asyncio.gather(*[translate_chunk(chunk, target_lang) for chunk in chunks]):
+        translations.update(result)
+        for text, translated in result.items():
+            # Unchanged text may be a failed request, so it is not remembered
+            if translated != text:
+                translation_cache[(text, target_lang)] = translated
+                if len(translation_cache) > TRANSLATION_CACHE_SIZE:
+                    translation_cache.popitem(last=False)
+    return translations
+
+def write_page(page, text_elements, translations):
+    """Redact a page's original text and write the translations in its place."""
+    print(f"Found {len(text_elements)} text elements to translate")
+
+    # Step 1: Redact (erase) all original text, one padded rect per line
+    line_rects = {}
+    for element in text_elements:
+        x0, y0, x1, y1 = element["bbox"]
+        merged = line_rects.get(element['line'])
+        if merged is None:
+            line_rects[element['line']] = [x0, y0, x1, y1]
+        else:
+            merged[0] = min(merged[0], x0)
+            merged[1] = min(merged[1], y0)
+            merged[2] = max(merged[2], x1)
+            merged[3] = max(merged[3], y1)
+    for x0, y0, x1, y1 in line_rects.values():
+        page.add_redact_annot(fitz.Rect(x0 - 0.5, y0 - 0.5, x1 + 0.5, y1 + 0.5), fill=None)
+
+    page.apply_redactions()
+
+
+    # Step 2: Add translated text
+    for i, element in enumerate(text_elements):
+        original_text = element['text']
+        print(f"  Translating ({i+1}/{len(text_elements)}): {original_text[:40]}...")
+        print(f"    Font type: {element['font_type']} (original: {element['original_font']})")
 
-    for page_num in range(total_pages):
-        page = doc[page_num]
-        print(f"\nTranslating page {page_num + 1}/{total_pages}")
-        blocks = page.get_text("dict")["blocks"]
-        text_elements = []
-
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        original_text = span["text"].strip()
-                        if original_text:
-                            font_type = get_font_type(span)
-                            bbox = span["bbox"]
-                            text_elements.append({
-                                'text': original_text,
-                                'bbox': bbox,
-                                'size': span["size"],
-                                'flags': span.get("flags", 0),
-                                'font_type': font_type,
-                                'original_font': span.get('font', ''),
-                                'origin': span.get("origin", (bbox[0], bbox[3] - 2)),
-                                'rotation': span.get("text_angle", 0),
-                                'color': span.get('color', 0)
-                            })
-
-        print(f"Found {len(text_elements)} text elements to translate")
-
-        # Step 1: Redact (erase) all original text
-        for element in text_elements:
-            rect = fitz.Rect(element["bbox"])
-            rect.x0 -= 0.5
-            rect.y0 -= 0.5
-            rect.x1 += 0.5
-            rect.y1 += 0.5
-            page.add_redact_annot(rect, fill=None)
-
-        page.apply_redactions()
-
-
-        # Step 2: Add translated text
-        for i, element in enumerate(text_elements):
-            original_text = element['text']
-            print(f"  Translating ({i+1}/{len(text_elements)}): {original_text[:40]}...")
-            print(f"    Font type: {element['font_type']} (original: {element['original_font']})")
-
-            translated_text = translate_text(original_text, target_lang)
-            pymupdf_font = get_pymupdf_font(element['font_type'])
-            text_color = convert_color_to_rgb(element['color'])
-            x, y = element['origin']
-
-            try:
-                if element['font_type'] == 'bold':
-                    # Try bold font, fallback to simulated bold
-                    try:
-                        page.insert_text(
-                            point=(x, y),
-                            text=translated_text,
-                            fontsize=element['size'],
-                            fontname="helv-bold",
-                            color=text_color,
-                            rotate=element['rotation']
-                        )
-                    except:
-                        page.insert_text(
-                            point=(x, y),
-                            text=translated_text,
-                            fontsize=element['size'],
-                            fontname="helv",
-                            color=text_color,
-                            rotate=element['rotation']
-                        )
-                        page.insert_text(
-                            point=(x + 0.5, y),
-                            text=translated_text,
-                            fontsize=element['size'],
-                            fontname="helv",
-                            color=text_color,
-                            rotate=element['rotation']
-                        )
-                else:
+        translated_text = translations.get(original_text, original_text)
+        pymupdf_font = element['pymupdf_font']
+        text_color = convert_color_to_rgb(element['color'])
+        x, y = element['origin']
+
+        try:
+            if element['font_type'] == 'bold':
+                # Try bold font, fallback to simulated bold
+                try:
                     page.insert_text(
                         point=(x, y),
                         text=translated_text,
                         fontsize=element['size'],
+                        fontname=pymupdf_font,
+                        color=text_color,
+                        rotate=element['rotation']
+                    )
+                except:
+                    page.insert_text(
+                        point=(x, y),
+                        text=translated_text,
+                        fontsize=element['size'],
+                        fontname="helv",
+                        color=text_color,
+                        rotate=element['rotation']
+                    )
+                    page.insert_text(
+                        point=(x + 0.5, y),
+                        text=translated_text,
+                        fontsize=element['size'],
                         fontname="helv",
                         color=text_color,
                         rotate=element['rotation']
                     )
-            except Exception as e:
-                print(f"    Error writing text: {e}")
+            else:
                 page.insert_text(
                     point=(x, y),
                     text=translated_text,
                     fontsize=element['size'],
                     fontname="helv",
-                    color=(0, 0, 0),
+                    color=text_color,
                     rotate=element['rotation']
                 )
+        except Exception as e:
+            print(f"    Error writing text: {e}")
+            page.insert_text(
+                point=(x, y),
+                text=translated_text,
+                fontsize=element['size'],
+                fontname="helv",
+                color=(0, 0, 0),
+                rotate=element['rotation']
+            )
+
+# Page-range worker processes; each reopens the input, so a worker gets at least a few pages
+MAX_WORKERS = 8
+MIN_PAGES_PER_WORKER = 4
 
-    doc.save(output_pdf_path)
+def _process_page_range(args):
+    """Worker: write pages [lo, hi) of the input PDF and save them to tmp_path."""
+    input_pdf_path, lo, hi, page_elements, translations, tmp_path = args
+    doc = fitz.open(input_pdf_path)
+    for page_num in range(lo, hi):
+        print(f"\nTranslating page {page_num + 1}")
+        write_page(doc[page_num], page_elements[page_num - lo], translations)
+    doc.select(list(range(lo, hi)))
+    # Garbage collection drops the objects of pages outside this range
+    doc.save(tmp_path, garbage=4, deflate=True)
     doc.close()
+    return tmp_path
+
+def translate_pdf(input_pdf_path, output_pdf_path, target_lang="Spanish"):
+    doc = fitz.open(input_pdf_path)
+    total_pages = len(doc)
+
+    # Collect every page first so the whole document is translated in one concurrent pass;
+    # each unique string (headers, footers, labels) is sent once
+    page_elements = [extract_text_elements(doc[page_num]) for page_num in range(total_pages)]
+    metadata, toc = doc.metadata, doc.get_toc(simple=False)
+    doc.close()
+    unique_texts = list(dict.fromkeys(e['text'] for elements in page_elements for e in elements))
+    print(f"Translating {len(unique_texts)} unique strings")
+    translations = asyncio.run(translate_all(unique_texts, target_lang))
+
+    # Pages are independent, so page ranges are redacted and rewritten in parallel processes
+    workers = max(1, min(multiprocessing.cpu_count(), MAX_WORKERS, total_pages // MIN_PAGES_PER_WORKER))
+    bounds = [round(i * total_pages / workers) for i in range(workers + 1)]
+    tmp_dir = tempfile.mkdtemp(prefix="pdf-trans-")
+    try:
+        tasks = []
+        for i in range(workers):
+            lo, hi = bounds[i], bounds[i + 1]
+            elements = page_elements[lo:hi]
+            needed = {e['text'] for page in elements for e in page}
+            tasks.append((input_pdf_path, lo, hi, elements,
+                          {text: translations[text] for text in needed if text in translations},
+                          os.path.join(tmp_dir, f"part_{i}.pdf")))
+        if workers == 1:
+            part_paths = [_process_page_range(tasks[0])]
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                part_paths = pool.map(_process_page_range, tasks)
+
+        # Merge the page ranges in order; the merged document starts empty, so it
+        # takes the input's metadata and outline
+        out = fitz.open()
+        for part_path in part_paths:
+            with fitz.open(part_path) as part:
+                out.insert_pdf(part)
+        out.set_metadata(metadata)
+        out.set_toc(toc)
+        out.save(output_pdf_path)
+        out.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
     print(f"\n✅ Translation complete. Saved to: {output_pdf_path}")
 
 # Run the translator
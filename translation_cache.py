@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Location of the on-disk cache, shared by every run (and every worker process)
+CACHE_PATH = os.environ.get("TRANSLATION_CACHE_PATH", "translation_cache.db")
+
+
+def make_key(text: str, target_lang: str, model: str, temperature: float = 0.2) -> str:
+    """
+    Build the cache key for a translation request.
+    """
+    raw = f"{model}|{temperature}|{target_lang}|{text.strip()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Variable tokens (codes/IDs first, then numbers and amounts) stripped out of templates.
+# An ID must contain a digit: all-caps words such as headers are text, not codes
+_VARIABLE_RE = re.compile(r'\b(?P<id>(?=[A-Z]*\d)[A-Z0-9]{4,})\b|(?P<num>\$?\d[\d,\.]*)')
+_SLOT_RE = re.compile(r'<V(\d+)>')
+
+
+def make_template(text: str) -> Tuple[str, List[str]]:
+    """
+    Replace numbers and codes with placeholders, e.g. "Copay: $20" -> "Copay: <N>".
+    Returns the template and the stripped values in order of appearance.
+    """
+    values = []
+
+    def _replace(match):
+        values.append(match.group(0))
+        return "<ID>" if match.group("id") else "<N>"
+
+    template = _VARIABLE_RE.sub(_replace, text.strip())
+    return template, values
+
+
+def templatize_translation(translated: str, values: List[str]) -> Optional[str]:
+    """
+    Swap each value in a translation for an indexed slot (<V0>, <V1>, ...).
+    Returns None if any value did not survive the translation verbatim as a whole
+    word, or also occurs inside a longer word (it could not be told apart from it).
+    """
+    # Search a masked copy so a value is never matched inside an earlier one
+    masked = translated
+    slots = []
+    for i, value in enumerate(values):
+        pattern = re.compile(rf'(?<!\w){re.escape(value)}(?!\w)')
+        if len(pattern.findall(translated)) != translated.count(value):
+            return None
+        match = pattern.search(masked)
+        if match is None:
+            return None
+        pos = match.start()
+        masked = masked[:pos] + "\0" * len(value) + masked[pos + len(value):]
+        slots.append((pos, len(value), i))
+
+    for pos, length, i in sorted(slots, reverse=True):
+        translated = f"{translated[:pos]}<V{i}>{translated[pos + length:]}"
+    return translated
+
+
+def fill_template(template_translation: str, values: List[str]) -> Optional[str]:
+    """
+    Put the values of the current text back into a cached template translation.
+    """
+    slots = [int(i) for i in _SLOT_RE.findall(template_translation)]
+    if sorted(slots) != list(range(len(values))):
+        return None
+    return _SLOT_RE.sub(lambda m: values[int(m.group(1))], template_translation)
+
+
+class TranslationCache:
+    """
+    Translation cache backed by a single SQLite table.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self._connect()
+
+    def _connect(self) -> None:
+        # Generous busy timeout: several worker processes may write at once
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+        )
+        # Caches written before entries carried a timestamp
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(translations)")}
+        if "created" not in columns:
+            self.conn.execute("ALTER TABLE translations ADD COLUMN created REAL")
+        self.conn.commit()
+
+    def reopen(self) -> None:
+        """
+        Open a fresh connection, e.g. in a worker process after fork.
+        """
+        self.lock = threading.Lock()
+        self._connect()
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        Look up a translation; with max_age (seconds), older entries count as misses.
+        """
+        with self.lock:
+            if max_age is None:
+                row = self.conn.execute(
+                    "SELECT value FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT value FROM translations WHERE key = ? AND created >= ?",
+                    (key, time.time() - max_age),
+                ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        with self.lock:
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self.conn.commit()
+            except sqlite3.OperationalError as e:
+                # A missed cache write only costs a future API call
+                print(f"Translation cache write failed: {e}")
+
+    def seed(self, items: Dict[str, str]) -> None:
+        """
+        Insert key/value pairs without overwriting existing entries.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO translations (key, value, created) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+# Open one connection at import time
+cache = TranslationCache()
@@ -0,0 +1,229 @@
+"""
+TensorRT engines for EasyOCR's CRAFT detector and CRNN recognizer.
+
+install_engines(reader) exports both torch modules to ONNX, builds FP16
+engines (cached per GPU architecture, e.g. trt_engines/detector_sm86_fp16.engine)
+and swaps them into the reader, so reader.readtext / readtext_batched run on
+TensorRT without any other change. Requires the `tensorrt` package and a CUDA GPU;
+otherwise the reader is left untouched.
+"""
+import os
+from typing import Dict, List, Tuple
+
+import torch
+
+try:
+    import tensorrt as trt
+except ImportError:
+    trt = None
+
+ENGINE_DIR = os.environ.get("TRT_ENGINE_DIR", "trt_engines")
+
+# (min, opt, max) input shapes for each engine's optimization profile
+DETECTOR_SHAPES = ((1, 3, 64, 64), (1, 3, 1024, 800), (16, 3, 2560, 2560))
+RECOGNIZER_SHAPES = ((1, 1, 64, 32), (16, 1, 64, 512), (64, 1, 64, 4096))
+
+_TORCH_DTYPES = {}
+if trt is not None:
+    _TORCH_DTYPES = {
+        trt.float32: torch.float32,
+        trt.float16: torch.float16,
+        trt.int32: torch.int32,
+        trt.int64: torch.int64,
+        trt.bool: torch.bool,
+    }
+
+
+def engine_path(name: str) -> str:
+    major, minor = torch.cuda.get_device_capability()
+    return os.path.join(ENGINE_DIR, f"{name}_sm{major}{minor}_fp16.engine")
+
+
+def export_onnx(module: torch.nn.Module, dummy: torch.Tensor, path: str,
+                output_names: List[str], dynamic_axes: Dict[str, Dict[int, str]]) -> None:
+    module.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            module, (dummy,), path,
+            input_names=["input"], output_names=output_names,
+            dynamic_axes=dynamic_axes, opset_version=17,
+        )
+
+
+def build_engine(onnx_path: str, shapes: Tuple[Tuple[int, ...], ...]) -> bytes:
+    """
+    Build a serialized FP16 engine with one optimization profile for "input".
+    """
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    with open(onnx_path, "rb") as f:
+        if not parser.parse(f.read()):
+            errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+            raise RuntimeError(f"ONNX parse failed for {onnx_path}: {errors}")
+
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.FP16)
+    profile = builder.create_optimization_profile()
+    profile.set_shape("input", *shapes)
+    config.add_optimization_profile(profile)
+
+    engine = builder.build_serialized_network(network, config)
+    if engine is None:
+        raise RuntimeError(f"TensorRT build failed for {onnx_path}")
+    return bytes(engine)
+
+
+def load_or_build(name: str, module: torch.nn.Module, dummy: torch.Tensor,
+                  output_names: List[str], dynamic_axes: Dict[str, Dict[int, str]],
+                  shapes: Tuple[Tuple[int, ...], ...]) -> "TRTInferSession":
+    path = engine_path(name)
+    if not os.path.exists(path):
+        os.makedirs(ENGINE_DIR, exist_ok=True)
+        onnx_path = os.path.join(ENGINE_DIR, f"{name}.onnx")
+        export_onnx(module, dummy, onnx_path, output_names, dynamic_axes)
+        with open(path, "wb") as f:
+            f.write(build_engine(onnx_path, shapes))
+    with open(path, "rb") as f:
+        return TRTInferSession(f.read())
+
+
+class TRTInferSession:
+    """
+    Runs one engine on its own CUDA stream. Output buffers are kept between
+    calls and only reallocated when a larger shape comes in; CPU inputs are
+    staged through pinned host memory.
+    """
+
+    def __init__(self, engine_bytes: bytes):
+        runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        self.engine = runtime.deserialize_cuda_engine(engine_bytes)
+        self.context = self.engine.create_execution_context()
+        self.stream = torch.cuda.Stream()
+        names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.inputs = [n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT]
+        self.outputs = [n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT]
+        self._device: Dict[str, torch.Tensor] = {}
+        self._pinned: Dict[str, torch.Tensor] = {}
+
+    def _buffer(self, pool: Dict[str, torch.Tensor], name: str, shape: Tuple[int, ...],
+                dtype: torch.dtype, **kwargs) -> torch.Tensor:
+        numel = 1
+        for dim in shape:
+            numel *= dim
+        buf = pool.get(name)
+        if buf is None or buf.numel() < numel or buf.dtype != dtype:
+            buf = torch.empty(numel, dtype=dtype, **kwargs)
+            pool[name] = buf
+        return buf[:numel].view(shape)
+
+    def run(self, **inputs: torch.Tensor) -> List[torch.Tensor]:
+        with torch.cuda.stream(self.stream):
+            for name in self.inputs:
+                tensor = inputs[name].float().contiguous()
+                if not tensor.is_cuda:
+                    staged = self._buffer(self._pinned, name, tuple(tensor.shape), tensor.dtype, pin_memory=True)
+                    staged.copy_(tensor)
+                    tensor = staged.to("cuda", non_blocking=True)
+                self.context.set_input_shape(name, tuple(tensor.shape))
+                self.context.set_tensor_address(name, tensor.data_ptr())
+                inputs[name] = tensor  # keep alive until the stream is done
+
+            outputs = []
+            for name in self.outputs:
+                shape = tuple(self.context.get_tensor_shape(name))
+                dtype = _TORCH_DTYPES[self.engine.get_tensor_dtype(name)]
+                out = self._buffer(self._device, name, shape, dtype, device="cuda")
+                self.context.set_tensor_address(name, out.data_ptr())
+                outputs.append(out)
+
+            if not self.context.execute_async_v3(self.stream.cuda_stream):
+                raise RuntimeError("TensorRT execution failed")
+        self.stream.synchronize()
+        # Callers may hold on to results across calls, so hand out copies
+        return [out.clone() for out in outputs]
+
+
+class _RecognizerImageOnly(torch.nn.Module):
+    # EasyOCR's CTC recognizers take a `text` argument they never use
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image):
+        return self.model(image, None)
+
+
+class TRTDetector:
+    """
+    Drop-in for reader.detector: net(x) -> (y, feature).
+    Shapes outside the engine profile fall back to the torch module.
+    """
+
+    def __init__(self, session: TRTInferSession, fallback):
+        self.session = session
+        self.fallback = fallback
+
+    def eval(self):
+        return self
+
+    def __call__(self, x):
+        try:
+            y, feature = self.session.run(input=x)
+        except Exception:
+            return self.fallback(x)
+        return y, feature
+
+
+class TRTRecognizer:
+    """
+    Drop-in for reader.recognizer: model(image, text) -> preds.
+    """
+
+    def __init__(self, session: TRTInferSession, fallback):
+        self.session = session
+        self.fallback = fallback
+
+    def eval(self):
+        return self
+
+    def __call__(self, image, text=None):
+        try:
+            return self.session.run(input=image)[0]
+        except Exception:
+            return self.fallback(image, text)
+
+
+def install_engines(reader) -> bool:
+    """
+    Swap TensorRT engines into an EasyOCR reader. Returns False (and leaves
+    the reader as is) when TensorRT or a GPU is unavailable or the build fails.
+    """
+    if trt is None or not torch.cuda.is_available():
+        return False
+
+    detector = getattr(reader.detector, "module", reader.detector)
+    recognizer = getattr(reader.recognizer, "module", reader.recognizer)
+    try:
+        det_session = load_or_build(
+            "detector", detector, torch.randn(1, 3, 640, 640, device="cuda"),
+            ["y", "feature"],
+            {"input": {0: "batch", 2: "height", 3: "width"},
+             "y": {0: "batch", 1: "out_height", 2: "out_width"},
+             "feature": {0: "batch", 2: "out_height", 3: "out_width"}},
+            DETECTOR_SHAPES,
+        )
+        rec_session = load_or_build(
+            "recognizer", _RecognizerImageOnly(recognizer), torch.randn(1, 1, 64, 256, device="cuda"),
+            ["preds"],
+            {"input": {0: "batch", 3: "width"}, "preds": {0: "batch", 1: "steps"}},
+            RECOGNIZER_SHAPES,
+        )
+    except Exception as e:
+        print(f"⚠️ TensorRT engines unavailable, keeping PyTorch OCR: {e}")
+        return False
+
+    reader.detector = TRTDetector(det_session, reader.detector)
+    reader.recognizer = TRTRecognizer(rec_session, reader.recognizer)
+    return True
@@ -1,20 +1,26 @@
+import traceback
+
+import fitz  # PyMuPDF
+import numpy as np
+
+FONT_MAP = {
+    'bold': 'helv-bold',
+    'light': 'helv',
+    'regular': 'helv'
+}
+
 def get_font_type(span):
     font_name = span.get('font', '').lower()
     flags = span.get('flags', 0)
-    if 'bold' in font_name or flags == 20:
+    if flags & 16 or 'bold' in font_name:
         return 'bold'
-    elif 'light' in font_name or flags == 4:
+    elif flags == 4 or 'light' in font_name:
         return 'light'
     else:
         return 'regular'
 
 def get_pymupdf_font(font_type):
-    font_map = {
-        'bold': 'helv-bold',
-        'light': 'helv',
-        'regular': 'helv'
-    }
-    return font_map.get(font_type, 'helv')
+    return FONT_MAP.get(font_type, 'helv')
 
 def convert_color_to_rgb(color_value):
     if isinstance(color_value, (int, float)):
@@ -32,122 +38,166 @@ def convert_color_to_rgb(color_value):
     else:
         return (0, 0, 0)
 
-def detect_background_color(page, bbox, zoom=2):
+_CHANNEL_SHIFTS = np.array([16, 8, 0], dtype=np.uint32)
+
+def convert_colors_to_rgb(colors):
+    """Vector form of convert_color_to_rgb: a list of span colors -> (n, 3) float32 RGB."""
+    rgb = np.zeros((len(colors), 3), dtype=np.float32)
+    # Packed sRGB ints take the broadcast path; list/tuple colors are copied as given
+    packed = np.array([isinstance(c, (int, float)) for c in colors], dtype=bool)
+    for i in np.flatnonzero(~packed):
+        rgb[i] = convert_color_to_rgb(colors[i])
+
+    values = np.array([c if p else 0 for c, p in zip(colors, packed)], dtype=np.int64)
+    ints = np.clip(values, 0, 0xFFFFFF).astype(np.uint32)
+    rgb[packed] = ((ints[packed, None] >> _CHANNEL_SHIFTS) & 0xFF).astype(np.float32) * (1.0 / 255.0)
+    rgb[packed & (values == 1)] = 1
+    return rgb
+
+def pixmap_to_array(pix):
+    """View a pixmap's samples as an (height, width, 3) RGB array."""
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[:, :, :3]
+
+def detect_background_color(arr, bbox, zoom=2):
+    """Most common color (in 0.1 steps) of the four corners around bbox and its center,
+    sampled from a page rendered at `zoom` and converted with pixmap_to_array."""
     try:
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-
+        height, width = arr.shape[:2]
         x0, y0, x1, y1 = [int(v * zoom) for v in bbox]
         margin = 4 * zoom
 
-        sample_coords = [
-            (max(0, x0 - margin), max(0, y0 - margin)),
-            (min(pix.width-1, x1 + margin), max(0, y0 - margin)),
-            (max(0, x0 - margin), min(pix.height-1, y1 + margin)),
-            (min(pix.width-1, x1 + margin), min(pix.height-1, y1 + margin)),
-            ((x0 + x1) // 2, (y0 + y1) // 2),
-        ]
-
-        colors = []
-        for x, y in sample_coords:
-            try:
-                r, g, b = pix.pixel(x, y)[:3]
-                colors.append((round(r / 255, 2), round(g / 255, 2), round(b / 255, 2)))
-            except:
-                continue
-
-        if colors:
-            rounded_colors = [tuple(round(c, 1) for c in color) for color in colors]
-            return Counter(rounded_colors).most_common(1)[0][0]
-        return (1, 1, 1)
+        xs = np.clip([x0 - margin, x1 + margin, x0 - margin, x1 + margin, (x0 + x1) // 2], 0, width - 1)
+        ys = np.clip([y0 - margin, y0 - margin, y1 + margin, y1 + margin, (y0 + y1) // 2], 0, height - 1)
+        # Each channel becomes 0..10; the most common packed key wins, ties going to
+        # the first sampled (as with Counter.most_common)
+        steps = np.rint(arr[ys, xs] * (10 / 255.0)).astype(np.intp)
+        keys = (steps[:, 0] * 11 + steps[:, 1]) * 11 + steps[:, 2]
+        counts = np.bincount(keys)
+        winner = int(keys[np.argmax(counts[keys])])
+        return (winner // 121 / 10, winner // 11 % 11 / 10, winner % 11 / 10)
     except Exception as e:
         print(f"BG detect error: {e}")
         return (1, 1, 1)
 
+def detect_background_color_clip(page, bbox, zoom=2):
+    """Same sampling as detect_background_color, but rasterizes only bbox plus its margin."""
+    clip = (fitz.Rect(bbox) + (-4, -4, 4, 4)) & page.rect
+    arr = pixmap_to_array(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip))
+    x0, y0, x1, y1 = bbox
+    return detect_background_color(arr, (x0 - clip.x0, y0 - clip.y0, x1 - clip.x0, y1 - clip.y0), zoom)
+
 def is_dark_color(rgb, threshold=0.4):
     r, g, b = rgb
     return (r + g + b) / 3 < threshold
 
+# Background sampling resolution, and the largest page rendered whole for it
+BG_ZOOM = 2
+MAX_PAGE_PIXELS = 8_000_000
+
 def translate_pdf(input_pdf_path, output_pdf_path, target_lang="Spanish"):
     doc = fitz.open(input_pdf_path)
 
     for page_num, page in enumerate(doc):
         print(f"\nTranslating page {page_num + 1}/{len(doc)}")
+        # Render the page once and let every span sample it, unless the page is
+        # too large to rasterize whole; then only each span's neighbourhood is rendered
+        page_pixels = page.rect.width * page.rect.height * BG_ZOOM * BG_ZOOM
+        pix_arr = None
+        if page_pixels <= MAX_PAGE_PIXELS:
+            pix_arr = pixmap_to_array(page.get_pixmap(matrix=fitz.Matrix(BG_ZOOM, BG_ZOOM)))
+        bg_colors = {}  # rounded bbox -> background color
+
+        def background_for(bbox):
+            key = tuple(round(v) for v in bbox)
+            if key not in bg_colors:
+                if pix_arr is not None:
+                    bg_colors[key] = detect_background_color(pix_arr, bbox, BG_ZOOM)
+                else:
+                    bg_colors[key] = detect_background_color_clip(page, bbox, BG_ZOOM)
+            return bg_colors[key]
+
         blocks = page.get_text("dict")["blocks"]
-        text_elements = []
 
-        for block in blocks:
+        # Span attributes as parallel columns (structure of arrays)
+        texts, fonts, origins, colors, lines = [], [], [], [], []
+        bbox_list, sizes, rotations = [], [], []
+
+        for block_no, block in enumerate(blocks):
             if "lines" in block:
-                for line in block["lines"]:
+                for line_no, line in enumerate(block["lines"]):
                     for span in line["spans"]:
                         original_text = span["text"].strip()
                         if original_text:
                             bbox = span["bbox"]
-                            font_type = get_font_type(span)
-                            text_elements.append({
-                                'text': original_text,
-                                'bbox': bbox,
-                                'size': span["size"],
-                                'flags': span.get("flags", 0),
-                                'font_type': font_type,
-                                'original_font': span.get('font', ''),
-                                'origin': span.get("origin", (bbox[0], bbox[3] - 2)),
-                                'rotation': span.get("text_angle", 0),
-                                'color': span.get('color', 0),
-                            })
-
-        print(f"Found {len(text_elements)} text elements to translate")
-
-        # Redact original text
-        for el in text_elements:
-            rect = fitz.Rect(el["bbox"])
-            rect.x0 -= 0.5
-            rect.y0 -= 0.5
-            rect.x1 += 0.5
-            rect.y1 += 0.5
-
-            bg_color = detect_background_color(page, rect)
-            page.add_redact_annot(rect, fill=bg_color)
+                            texts.append(original_text)
+                            bbox_list.append(bbox)
+                            sizes.append(span["size"])
+                            fonts.append(get_pymupdf_font(get_font_type(span)))
+                            origins.append(span.get("origin", (bbox[0], bbox[3] - 2)))
+                            rotations.append(span.get("text_angle", 0))
+                            colors.append(span.get('color', 0))
+                            lines.append((block_no, line_no))
+
+        count = len(texts)
+        print(f"Found {count} text elements to translate")
+        if not count:
+            continue
+
+        bboxes = np.array(bbox_list, dtype=np.float32).reshape(count, 4)
+        text_rgb = convert_colors_to_rgb(colors)
+        bg_list = [background_for(bbox) for bbox in bbox_list]
+
+        # Light text on a dark background is rewritten in black
+        light_text = text_rgb.mean(axis=1) > 0.8
+        dark_bg = np.array([is_dark_color(bg) for bg in bg_list])
+        text_rgb[light_text & dark_bg] = 0
+
+        # Redact original text: spans on the same line with the same background share one rect
+        groups = {}
+        group_ids = np.array([groups.setdefault((lines[i], bg_list[i]), len(groups)) for i in range(count)])
+        merged = np.empty((len(groups), 4), dtype=np.float32)
+        merged[:, :2] = np.inf
+        merged[:, 2:] = -np.inf
+        np.minimum.at(merged[:, :2], group_ids, bboxes[:, :2])
+        np.maximum.at(merged[:, 2:], group_ids, bboxes[:, 2:])
+        merged += np.array([-0.5, -0.5, 0.5, 0.5], dtype=np.float32)
+
+        for (_, bg_color), rect in zip(groups, merged.tolist()):
+            page.add_redact_annot(fitz.Rect(rect), fill=bg_color)
 
         page.apply_redactions()
 
         # Add translated text
-        for i, el in enumerate(text_elements):
-            print(f"  Translating ({i+1}/{len(text_elements)}): {el['text'][:40]}...")
-
-            #translated = translate_text(el['text'], target_lang)
-            translated = el['text']
-            font = get_pymupdf_font(el['font_type'])
-            x, y = el['origin']
-            rotation = el['rotation']
-            text_color = convert_color_to_rgb(el['color'])
+        for i in range(count):
+            print(f"  Translating ({i+1}/{count}): {texts[i][:40]}...")
 
-            # Force black if background is dark and text is light
-            bg_color = detect_background_color(page, el['bbox'])
-            if is_dark_color(bg_color) and sum(text_color) / 3 > 0.8:
-                text_color = (0, 0, 0)
+            #translated = translate_text(texts[i], target_lang)
+            translated = texts[i]
+            x, y = origins[i]
+            text_color = tuple(text_rgb[i].tolist())
 
             try:
                 page.insert_text(
                     point=(x, y),
                     text=translated,
-                    fontsize=el['size'],
-                    fontname=font,
+                    fontsize=sizes[i],
+                    fontname=fonts[i],
                     color=text_color,
-                    rotate=rotation
+                    rotate=rotations[i]
                 )
             except Exception as e:
                 print(f"    Error: {e} — using fallback font")
                 page.insert_text(
                     point=(x, y),
                     text=translated,
-                    fontsize=el['size'],
+                    fontsize=sizes[i],
                     fontname="helv",
                     color=text_color,
-                    rotate=rotation
+                    rotate=rotations[i]
                 )
 
-    doc.save(output_pdf_path)
+    # Drop objects orphaned by the redactions, merge duplicates and compress streams
+    doc.save(output_pdf_path, garbage=4, deflate=True, deflate_images=True, clean=True)
     doc.close()
     print(f"\n✅ Translation complete. Saved to: {output_pdf_path}")
 
@@ -1,15 +1,34 @@
+import asyncio
+import functools
+import json
 import fitz  # PyMuPDF
-from openai import OpenAI
-import time
+import numpy as np
+from translation_cache import cache, make_key
+from openai import AsyncOpenAI
+import math
 import os
-from collections import Counter
+import re
+import multiprocessing
+import shutil
+import tempfile
 import traceback
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Optional
 
 # Load API key from environment variable for security
-client = OpenAI(api_key="sss")
+client = AsyncOpenAI(api_key="sss")
+MODEL_NAME = "gpt-3.5-turbo"
+# Deterministic sampling, so a text always gets the same (cacheable) translation
+TEMPERATURE = 0
+SEED = 42
+# Cache entries are scoped to this script's prompts, so another script sharing the
+# cache with the same model and temperature never reuses a translation made with its rules
+CACHE_NAMESPACE = f"{MODEL_NAME}|v4"
 
-def translate_text(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
+# Requests allowed in flight at once, to stay under the rate limit
+MAX_CONCURRENT_REQUESTS = 20
+request_semaphore = None  # created inside the running event loop
+
+async def translate_text(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
     """
     Translate text using OpenAI API with retry logic.
     
@@ -28,22 +47,177 @@ def translate_text(text: str, target_lang: str = "Spanish", retries: int = 3) ->
     
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=1000
-            )
+            async with request_semaphore:
+                response = await client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=TEMPERATURE,
+                    seed=SEED
+                )
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Translation attempt {attempt + 1} failed: {e}")
             if attempt < retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff
             else:
                 print(f"Failed to translate after {retries} attempts: {text[:50]}...")
     
     return text
 
+# Spans sent per batched request, capped by their total length
+BATCH_MAX_ITEMS = 10
+BATCH_MAX_CHARS = 3000
+
+def chunk_texts(texts: List[str]) -> List[List[str]]:
+    """
+    Group texts into batches of at most BATCH_MAX_ITEMS items and BATCH_MAX_CHARS characters.
+    
+    Args:
+        texts: Texts to group, in order
+    
+    Returns:
+        List of batches
+    """
+    batches, batch, size = [], [], 0
+    for text in texts:
+        if batch and (len(batch) >= BATCH_MAX_ITEMS or size + len(text) > BATCH_MAX_CHARS):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def parse_json_array(content: str) -> List[Any]:
+    """
+    Parse a JSON array from a model reply, tolerating a ```json fence around it.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").strip()
+        if content.lower().startswith("json"):
+            content = content[4:]
+    result = json.loads(content)
+    if not isinstance(result, list):
+        raise ValueError("reply is not a JSON array")
+    return result
+
+async def translate_batch(texts: List[str], target_lang: str = "Spanish") -> List[str]:
+    """
+    Translate several texts with one request that returns a JSON array.
+    
+    Args:
+        texts: Texts to translate
+        target_lang: Target language for translation
+    
+    Returns:
+        Translations aligned with texts; a reply that fails or is misaligned is retried
+        as two half-size batches
+    """
+    if len(texts) == 1:
+        return [await translate_text(texts[0], target_lang)]
+    
+    prompt = (f"Translate each English segment in this JSON array to {target_lang}, preserving format and tone. "
+              f"Return only a JSON array of strings with the translations in the same order.\n\n"
+              + json.dumps(texts, ensure_ascii=False))
+    try:
+        async with request_semaphore:
+            response = await client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=TEMPERATURE,
+                seed=SEED
+            )
+        translations = parse_json_array(response.choices[0].message.content)
+        if len(translations) == len(texts) and all(isinstance(t, str) for t in translations):
+            return [t.strip() for t in translations]
+        print(f"Batch reply had {len(translations)} items for {len(texts)} texts, splitting the batch")
+    except Exception as e:
+        print(f"Batch translation of {len(texts)} texts failed, splitting the batch: {e}")
+    
+    # Halving keeps a bad batch to a few requests; only the last one or two texts go alone
+    if len(texts) <= 2:
+        return list(await asyncio.gather(*[translate_text(text, target_lang) for text in texts]))
+    half = len(texts) // 2
+    first, second = await asyncio.gather(translate_batch(texts[:half], target_lang),
+                                         translate_batch(texts[half:], target_lang))
+    return first + second
+
+async def translate_texts(texts: List[str], target_lang: str = "Spanish") -> Dict[str, str]:
+    """
+    Translate texts with all batches in flight together.
+    
+    Args:
+        texts: Texts collected from every page (repeats allowed)
+        target_lang: Target language for translation
+    
+    Returns:
+        Mapping of each text to its translation
+    """
+    global request_semaphore
+    request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    # Each unique text is looked up in the on-disk cache; misses are sent once, packed into batches
+    translations = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        cached = cache.get(make_key(text, target_lang, CACHE_NAMESPACE, TEMPERATURE))
+        if cached is not None:
+            translations[text] = cached
+        else:
+            pending.append(text)
+    print(f"   {len(translations)} cached, {len(pending)} to translate")
+    
+    batches = chunk_texts(pending)
+    tasks = [asyncio.create_task(translate_batch(batch, target_lang)) for batch in batches]
+    new_translations = {}
+    for batch, results in zip(batches, await asyncio.gather(*tasks)):
+        new_translations.update(zip(batch, results))
+    translations.update(new_translations)
+    
+    # One transaction for the whole document; unchanged text may be a failed request, so it is not stored
+    cache.seed({make_key(text, target_lang, CACHE_NAMESPACE, TEMPERATURE): translated
+                for text, translated in new_translations.items() if translated != text})
+    
+    return translations
+
+# Patterns for text that is kept as-is, compiled once at import
+_RE_NUM = re.compile(r'^\d+$')
+_RE_CURRENCY = re.compile(r'^\$\d+([,\d]*\.?\d*)?$')
+_RE_CODE = re.compile(r'^[A-Z0-9]{3,}$')
+_SKIP_ABBREVS = frozenset({'N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC'})
+
+def should_translate_text(text: str) -> bool:
+    """
+    Decide whether a span is worth sending for translation.
+    
+    Args:
+        text: Span text
+    
+    Returns:
+        False for numbers, currency amounts, codes, abbreviations and text with fewer than three letters
+    """
+    text = text.strip()
+    
+    if len(text) <= 2:
+        return False
+    
+    if _RE_NUM.match(text) or _RE_CURRENCY.match(text) or _RE_CODE.match(text):
+        return False
+    
+    if text.upper() in _SKIP_ABBREVS:
+        return False
+    
+    # Stop scanning as soon as three letters have been seen
+    alpha_chars = 0
+    for c in text:
+        if c.isalpha():
+            alpha_chars += 1
+            if alpha_chars >= 3:
+                return True
+    return False
+
 def get_font_type(span: Dict[str, Any]) -> str:
     """
     Determine font type (bold, light, regular) from span data.
@@ -54,8 +228,12 @@ def get_font_type(span: Dict[str, Any]) -> str:
     Returns:
         Font type string
     """
-    font_name = span.get('font', '').lower()
-    flags = span.get('flags', 0)
+    return _font_type(span.get('font', ''), span.get('flags', 0))
+
+@functools.lru_cache(maxsize=256)
+def _font_type(font_name: str, flags: int) -> str:
+    # A document uses a handful of (font, flags) pairs, so each is classified once
+    font_name = font_name.lower()
     
     if 'bold' in font_name or flags & 16:  # Bold flag
         return 'bold'
@@ -66,6 +244,13 @@ def get_font_type(span: Dict[str, Any]) -> str:
     else:
         return 'regular'
 
+FONT_MAPPING = {
+    "bold": "Times-Bold",
+    "italic": "Times-Italic",
+    "light": "Times-Roman",
+    "regular": "Times-Roman"
+}
+
 def get_pymupdf_font(font_type: str) -> str:
     """
     Map font type to PyMuPDF font name.
@@ -76,13 +261,7 @@ def get_pymupdf_font(font_type: str) -> str:
     Returns:
         PyMuPDF font name
     """
-    font_mapping = {
-        "bold": "Times-Bold",
-        "italic": "Times-Italic",
-        "light": "Times-Roman",
-        "regular": "Times-Roman"
-    }
-    return font_mapping.get(font_type, "Times-Roman")
+    return FONT_MAPPING.get(font_type, "Times-Roman")
 
 def convert_color_to_rgb(color_value: Any) -> Tuple[float, float, float]:
     """
@@ -95,22 +274,46 @@ def convert_color_to_rgb(color_value: Any) -> Tuple[float, float, float]:
         RGB tuple with values between 0 and 1
     """
     if isinstance(color_value, (int, float)):
-        if color_value == 0:
-            return (0, 0, 0)  # Black
-        elif color_value == 1 or color_value >= 16777215:
-            return (1, 1, 1)  # White
-        else:
-            # Convert integer color to RGB
-            r = ((int(color_value) >> 16) & 255) / 255.0
-            g = ((int(color_value) >> 8) & 255) / 255.0
-            b = (int(color_value) & 255) / 255.0
-            return (r, g, b)
+        return _int_color_to_rgb(int(color_value))
     elif isinstance(color_value, (list, tuple)) and len(color_value) >= 3:
         return tuple(color_value[:3])
     else:
         return (0, 0, 0)  # Default to black
 
-def detect_background_color(page: fitz.Page, bbox: Tuple[float, float, float, float], zoom: int = 2) -> Tuple[float, float, float]:
+@functools.lru_cache(maxsize=256)
+def _int_color_to_rgb(color_value: int) -> Tuple[float, float, float]:
+    # Pages draw from a few distinct colors, so each is converted once
+    if color_value == 0:
+        return (0, 0, 0)  # Black
+    elif color_value == 1 or color_value >= 16777215:
+        return (1, 1, 1)  # White
+    else:
+        # Convert integer color to RGB
+        r = ((color_value >> 16) & 255) / 255.0
+        g = ((color_value >> 8) & 255) / 255.0
+        b = (color_value & 255) / 255.0
+        return (r, g, b)
+
+def quantized_mode(samples: np.ndarray) -> Tuple[float, float, float]:
+    """
+    Most common color among RGB samples (N x 3, uint8), in 0.1 steps per channel.
+    
+    Args:
+        samples: Sampled pixels
+    
+    Returns:
+        RGB tuple with values between 0 and 1
+    """
+    # Each channel becomes 0..10; the three pack into one key below 11**3.
+    # Ties go to the first sampled color, as with Counter.most_common
+    steps = np.rint(samples * (10 / 255.0)).astype(np.intp)
+    keys = (steps[:, 0] * 11 + steps[:, 1]) * 11 + steps[:, 2]
+    counts = np.bincount(keys)
+    winner = int(keys[np.argmax(counts[keys])])
+    return (winner // 121 / 10, winner // 11 % 11 / 10, winner % 11 / 10)
+
+def detect_background_color(page: fitz.Page, bbox: Tuple[float, float, float, float], zoom: int = 1,
+                            pix: Optional[fitz.Pixmap] = None) -> Tuple[float, float, float]:
     """
     Detect the background color of a text region.
     
@@ -118,35 +321,26 @@ def detect_background_color(page: fitz.Page, bbox: Tuple[float, float, float, fl
         page: PyMuPDF page object
         bbox: Bounding box coordinates
         zoom: Zoom factor for sampling
+        pix: Page already rendered at zoom, shared by every span of the page
     
     Returns:
         RGB tuple representing background color
     """
     try:
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
+        if pix is None:
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
         x0, y0, x1, y1 = [int(v * zoom) for v in bbox]
+        inset = max(1, round(2.5 * zoom))  # 2.5pt inside the corners at any zoom
         
-        # Sample multiple points around the text area
-        sample_coords = [
-            ((x0 + x1) // 2, (y0 + y1) // 2),  # Center
-            (x0 + 5, y0 + 5), (x1 - 5, y0 + 5),  # Top corners
-            (x0 + 5, y1 - 5), (x1 - 5, y1 - 5),  # Bottom corners
-        ]
+        # Sample multiple points around the text area: center, top corners, bottom corners
+        xs = np.array([(x0 + x1) // 2, x0 + inset, x1 - inset, x0 + inset, x1 - inset])
+        ys = np.array([(y0 + y1) // 2, y0 + inset, y0 + inset, y1 - inset, y1 - inset])
+        inside = (xs >= 0) & (xs < pix.width) & (ys >= 0) & (ys < pix.height)
         
-        colors = []
-        for x, y in sample_coords:
-            try:
-                if 0 <= x < pix.width and 0 <= y < pix.height:
-                    r, g, b = pix.pixel(x, y)[:3]
-                    colors.append((round(r / 255, 2), round(g / 255, 2), round(b / 255, 2)))
-            except:
-                continue
-        
-        if colors:
-            # Find most common color
-            rounded_colors = [tuple(round(c, 1) for c in color) for color in colors]
-            return Counter(rounded_colors).most_common(1)[0][0]
+        if inside.any():
+            # One gather over a zero-copy view of the pixmap, then the most common color
+            arr = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[:, :, :3]
+            return quantized_mode(arr[ys[inside], xs[inside]])
         
         return (1, 1, 1)  # Default to white
     except Exception as e:
@@ -187,6 +381,39 @@ def infer_rotation(span: Dict[str, Any]) -> int:
     
     return 0
 
+@functools.lru_cache(maxsize=None)
+def font_line_height(fontname: str) -> float:
+    """
+    Line height of a font as a multiple of its size, as insert_textbox lays lines out.
+    """
+    font = fitz.Font(fontname)
+    return font.ascender - font.descender
+
+def text_fits(rect: fitz.Rect, text: str, fontname: str, size: float, rotate: int) -> bool:
+    """
+    Predict whether text wraps into rect at the given size, from its measured width.
+    
+    Args:
+        rect: Rectangle to fit text within
+        text: Text to insert
+        fontname: Font name
+        size: Font size
+        rotate: Rotation angle
+    
+    Returns:
+        True if the wrapped lines are expected to fit
+    """
+    width, height = (rect.height, rect.width) if rotate % 180 == 90 else (rect.width, rect.height)
+    if width <= 0:
+        return False
+    try:
+        text_width = fitz.get_text_length(text, fontname=fontname, fontsize=size)
+        line_height = size * font_line_height(fontname)
+    except Exception:
+        text_width, line_height = len(text) * size * 0.5, size * 1.2
+    lines = max(1, math.ceil(text_width / width))
+    return lines * line_height <= height
+
 def shrink_font_to_fit(page: fitz.Page, rect: fitz.Rect, text: str, fontname: str, 
                       original_size: float, color: Tuple[float, float, float], rotate: int) -> None:
     """
@@ -201,35 +428,28 @@ def shrink_font_to_fit(page: fitz.Page, rect: fitz.Rect, text: str, fontname: st
         color: Text color
         rotate: Rotation angle
     """
-    # Try sizes from original down to minimum
+    # Largest whole size from original down to minimum that is predicted to fit
     min_size = max(4, original_size * 0.3)  # Don't go below 30% of original or 4pt
     
-    for size in range(int(original_size), int(min_size), -1):
+    hi = int(original_size)
+    while hi > int(min_size):
+        lo, best = int(min_size) + 1, None
+        while lo <= hi:
+            size = (lo + hi) // 2
+            if text_fits(rect, text, fontname, size, rotate):
+                best, lo = size, size + 1
+            else:
+                hi = size - 1
+        if best is None:
+            break
         try:
-            result = page.insert_textbox(
-                rect,
-                text,
-                fontname=fontname,
-                fontsize=size,
-                color=color,
-                rotate=rotate,
-                align=0,
-                render_mode=3  # Invisible mode for testing
-            )
-            if result >= 0:  # Success
-                # Now insert visibly
-                page.insert_textbox(
-                    rect,
-                    text,
-                    fontname=fontname,
-                    fontsize=size,
-                    color=color,
-                    rotate=rotate,
-                    align=0
-                )
+            # A textbox that does not fit is not drawn; then search again below that size
+            if page.insert_textbox(rect, text, fontname=fontname, fontsize=best,
+                                   color=color, rotate=rotate, align=0) >= 0:
                 return
-        except:
-            continue
+        except Exception:
+            pass
+        hi = best - 1
     
     # Fallback: insert with minimum size
     try:
@@ -245,6 +465,125 @@ def shrink_font_to_fit(page: fitz.Page, rect: fitz.Rect, text: str, fontname: st
     except Exception as e:
         print(f"Failed to insert text: {text[:30]}... Error: {e}")
 
+# Text extraction without image blocks: "dict" output otherwise carries every image's encoded bytes
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def extract_page(page: fitz.Page) -> Dict[str, Any]:
+    """
+    Extract a page's text spans as parallel columns: texts and translations as lists,
+    numeric attributes as NumPy arrays.
+    
+    Args:
+        page: PyMuPDF page object
+    
+    Returns:
+        Columns 'text', 'translated', 'bbox' (N x 4), 'size', 'color', 'rotation' and 'font_type'
+    """
+    spans = [span for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"] if "lines" in block
+             for line in block["lines"] for span in line["spans"]
+             if len(span["text"].strip()) >= 2]  # Skip very short text
+    
+    bboxes = np.array([span["bbox"] for span in spans], dtype=np.float32).reshape(-1, 4)
+    # Skip invalid bboxes, all at once
+    valid = np.flatnonzero((bboxes[:, 2] > bboxes[:, 0]) & (bboxes[:, 3] > bboxes[:, 1]))
+    spans = [spans[i] for i in valid]
+    
+    texts = [span["text"].strip() for span in spans]
+    return {
+        'text': texts,
+        # Numbers, amounts and codes stay as they are and never reach the model
+        'translated': [None if should_translate_text(text) else text for text in texts],
+        'bbox': bboxes[valid],
+        'size': np.array([span.get("size", 12) for span in spans], dtype=np.float32),
+        'color': np.array([span.get("color", 0) for span in spans], dtype=np.uint32),
+        'rotation': np.array([infer_rotation(span) for span in spans], dtype=np.int32),
+        'font_type': [get_font_type(span) for span in spans],
+    }
+
+def write_page(page: fitz.Page, columns: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Redact a page's original text and insert the translations in its place.
+    
+    Args:
+        page: PyMuPDF page object
+        columns: Translated columns of this page, from extract_page
+    
+    Returns:
+        Number of translations inserted, and number of spans to translate
+    """
+    texts, translations, bboxes = columns['text'], columns['translated'], columns['bbox']
+    # Spans left unchanged keep their original text, so only the others are redacted
+    indices = [i for i, (text, translated) in enumerate(zip(texts, translations)) if translated and translated != text]
+    
+    # Render the page once, as plain RGB at zoom 1 (nearest-pixel sampling needs no more);
+    # every span samples this pixmap
+    page_pix = page.get_pixmap(matrix=fitz.Matrix(1, 1), colorspace=fitz.csRGB, alpha=False)
+
+    # Redact original text, with small padding to ensure complete coverage
+    rects = bboxes + np.array([-1, -1, 1, 1], dtype=np.float32)
+    bg_colors = {}  # reused when the translation is inserted
+    for i in indices:
+        bg_colors[i] = detect_background_color(page, tuple(bboxes[i].tolist()), pix=page_pix)
+        page.add_redact_annot(fitz.Rect(rects[i].tolist()), fill=bg_colors[i])
+
+    # Apply all redactions at once; images under the rects are left alone rather than re-encoded
+    page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+
+    # Insert translated text
+    successful_insertions = 0
+    for i in indices:
+        try:
+            fontname = get_pymupdf_font(columns['font_type'][i])
+            color = convert_color_to_rgb(int(columns['color'][i]))
+            bg_color = bg_colors[i]
+            
+            # Adjust text color for better contrast
+            if is_dark_color(bg_color) and sum(color) / 3 > 0.8:
+                color = (1, 1, 1)  # White text on dark background
+            elif not is_dark_color(bg_color) and sum(color) / 3 < 0.2:
+                color = (0, 0, 0)  # Black text on light background
+            
+            rect = fitz.Rect(bboxes[i].tolist())
+            shrink_font_to_fit(page, rect, translations[i], fontname, float(columns['size'][i]), color,
+                               int(columns['rotation'][i]))
+            successful_insertions += 1
+            
+        except Exception as e:
+            print(f"   Failed to insert translation for: {texts[i][:30]}... Error: {e}")
+            continue
+
+    return successful_insertions, len(indices)
+
+# Processes that rewrite page ranges. Each one reopens the input and its part is
+# merged back at the end, so a worker is only worth it for a few pages or more
+MAX_WORKERS = 8
+MIN_PAGES_PER_WORKER = 4
+
+def write_pages(doc: fitz.Document, lo: int, hi: int, page_columns: List[Dict[str, Any]]) -> None:
+    """
+    Write the translations of pages [lo, hi) into the document.
+    """
+    for page_num in range(lo, hi):
+        print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
+        try:
+            successful_insertions, total = write_page(doc[page_num], page_columns[page_num - lo])
+            print(f"   Successfully inserted {successful_insertions}/{total} translations")
+        except Exception as e:
+            print(f"   Error processing page {page_num + 1}: {e}")
+
+def _process_page_range(args: Tuple[str, int, int, List[Dict[str, Any]], str]) -> str:
+    """
+    Worker: write pages [lo, hi) of the input PDF and save them to tmp_path.
+    """
+    input_pdf_path, lo, hi, page_columns, tmp_path = args
+    doc = fitz.open(input_pdf_path)
+    write_pages(doc, lo, hi, page_columns)
+    doc.select(list(range(lo, hi)))
+    # Garbage collection drops the objects of pages outside this range
+    doc.save(tmp_path, garbage=4, deflate=True)
+    doc.close()
+    return tmp_path
+
 def translate_pdf(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
     """
     Translate a PDF document to the specified language.
@@ -263,99 +602,57 @@ def translate_pdf(input_pdf_path: str, output_pdf_path: str, target_lang: str =
     doc = fitz.open(input_pdf_path)
     print(f"🔄 Starting translation of {len(doc)} pages to {target_lang}")
 
+    # Pass 1: extract text spans from every page
+    page_columns = []
     for page_num, page in enumerate(doc):
-        print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
-        
         try:
-            blocks = page.get_text("dict")["blocks"]
-            text_elements = []
-
-            # Extract text elements with their properties
-            for block in blocks:
-                if "lines" not in block:
-                    continue
-                
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        text = span["text"].strip()
-                        if not text or len(text) < 2:  # Skip very short text
-                            continue
-                        
-                        bbox = span["bbox"]
-                        
-                        # Skip if bbox is invalid
-                        if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
-                            continue
-                        
-                        translated_text = translate_text(text, target_lang)
-                        
-                        text_elements.append({
-                            'text': text,
-                            'translated': translated_text,
-                            'bbox': bbox,
-                            'size': span.get("size", 12),
-                            'font_type': get_font_type(span),
-                            'rotation': infer_rotation(span),
-                            'color': span.get("color", 0),
-                        })
-
-            print(f"   Found {len(text_elements)} text spans to translate")
-
-            # Redact original text
-            redaction_rects = []
-            for el in text_elements:
-                bbox = el["bbox"]
-                # Add small padding to ensure complete coverage
-                rect = fitz.Rect(
-                    bbox[0] - 1,
-                    bbox[1] - 1,
-                    bbox[2] + 1,
-                    bbox[3] + 1
-                )
-                
-                bg_color = detect_background_color(page, bbox)
-                redaction_rects.append((rect, bg_color))
-                
-                # Add redaction annotation
-                page.add_redact_annot(rect, fill=bg_color)
-
-            # Apply all redactions at once
-            page.apply_redactions()
-
-            # Insert translated text
-            successful_insertions = 0
-            for el in text_elements:
-                translated = el["translated"]
-                if not translated or translated == el["text"]:
-                    continue
-                
-                try:
-                    fontname = get_pymupdf_font(el["font_type"])
-                    color = convert_color_to_rgb(el["color"])
-                    bg_color = detect_background_color(page, el["bbox"])
-                    
-                    # Adjust text color for better contrast
-                    if is_dark_color(bg_color) and sum(color) / 3 > 0.8:
-                        color = (1, 1, 1)  # White text on dark background
-                    elif not is_dark_color(bg_color) and sum(color) / 3 < 0.2:
-                        color = (0, 0, 0)  # Black text on light background
-                    
-                    rect = fitz.Rect(el["bbox"])
-                    shrink_font_to_fit(page, rect, translated, fontname, el["size"], color, el["rotation"])
-                    successful_insertions += 1
-                    
-                except Exception as e:
-                    print(f"   Failed to insert translation for: {el['text'][:30]}... Error: {e}")
-                    continue
-
-            print(f"   Successfully inserted {successful_insertions}/{len(text_elements)} translations")
-            
+            columns = extract_page(page)
         except Exception as e:
-            print(f"   Error processing page {page_num + 1}: {e}")
-            continue
+            print(f"   Error reading page {page_num + 1}: {e}")
+            columns = {'text': [], 'translated': [], 'bbox': np.empty((0, 4), dtype=np.float32)}
+        print(f"   Page {page_num + 1}: found {len(columns['text'])} text spans")
+        page_columns.append(columns)
+
+    # Pass 2: translate every span of the document concurrently
+    pending = [text for columns in page_columns
+               for text, translated in zip(columns['text'], columns['translated']) if translated is None]
+    print(f"🌐 Translating {len(pending)} text spans")
+    translations = asyncio.run(translate_texts(pending, target_lang))
+    for columns in page_columns:
+        columns['translated'] = [translations.get(text, text) if translated is None else translated
+                                 for text, translated in zip(columns['text'], columns['translated'])]
+
+    # Pass 3: pages are independent, so page ranges are redacted and rewritten in parallel processes
+    # (PyMuPDF documents cannot be shared between threads)
+    total_pages = len(doc)
+    workers = max(1, min(multiprocessing.cpu_count(), MAX_WORKERS, total_pages // MIN_PAGES_PER_WORKER))
+    if workers == 1:
+        # A single range is rewritten in place, without the split and merge
+        write_pages(doc, 0, total_pages, page_columns)
+    else:
+        metadata, toc = doc.metadata, doc.get_toc(simple=False)
+        doc.close()
+        bounds = [round(i * total_pages / workers) for i in range(workers + 1)]
+        tmp_dir = tempfile.mkdtemp(prefix="pdf-translate-")
+        try:
+            tasks = [(input_pdf_path, bounds[i], bounds[i + 1], page_columns[bounds[i]:bounds[i + 1]],
+                      os.path.join(tmp_dir, f"part_{i}.pdf")) for i in range(workers)]
+            with multiprocessing.Pool(workers) as pool:
+                part_paths = pool.map(_process_page_range, tasks)
+
+            # Merge the page ranges in order; the merged document starts empty, so it
+            # takes the input's metadata and outline
+            doc = fitz.open()
+            for part_path in part_paths:
+                with fitz.open(part_path) as part:
+                    doc.insert_pdf(part)
+            doc.set_metadata(metadata)
+            doc.set_toc(toc)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    # Save the translated document
-    doc.save(output_pdf_path)
+    # Merge duplicate objects (e.g. the font embedded by every part) and compress streams
+    doc.save(output_pdf_path, garbage=4, deflate=True, deflate_images=True, clean=True)
     doc.close()
     print(f"\n✅ Translation completed! Saved to: {output_pdf_path}")
 
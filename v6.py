@@ -1,34 +1,69 @@
+import asyncio
+import functools
+import json
 import fitz  # PyMuPDF
-from openai import OpenAI
-import time
+import numpy as np
+from translation_cache import cache, make_key
 import os
+import multiprocessing
+import shutil
+import tempfile
 import ssl
-from collections import Counter
+from collections import Counter, OrderedDict
 import traceback
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Optional
 import re
 import httpx
-from langchain_openai import AzureChatOpenAI
 
-# Load custom SSL certificate and build HTTP client
+# Load custom SSL certificate for the HTTP client
 cert_data = os.environ.get("HUMANA_CERT")  # path to PEM or cert content
 ctx = ssl.create_default_context(cadata=cert_data)
-custom_client = httpx.Client(verify=ctx)
-
-# Init LLM via AzureChatOpenAI
-def get_llm_model(model_name="gpt-3.5-turbo", temperature=0.2):
-    return AzureChatOpenAI(
-        azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),  # e.g., https://example.openai.azure.com/
-        api_key=os.environ.get("AZURE_OPENAI_KEY"),
-        api_version="2024-02-15-preview",  # or your correct version
-        model=model_name,
-        temperature=temperature,
-        http_client=custom_client
-    )
-
-# Initialize model once
-llm = get_llm_model()
- 
+
+# Azure OpenAI chat completions, called directly over HTTP/2
+MODEL_NAME = "gpt-3.5-turbo"
+AZURE_OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT", "")  # e.g., https://example.openai.azure.com/
+AZURE_OPENAI_KEY = os.environ.get("AZURE_OPENAI_KEY")
+API_VERSION = "2024-02-15-preview"  # or your correct version
+# Deterministic sampling, so a text always gets the same (cacheable) translation
+TEMPERATURE = 0
+SEED = 42
+# Cache entries are scoped to this script's prompts, so another script sharing the
+# cache with the same model and temperature never reuses a translation made with its rules
+CACHE_NAMESPACE = f"{MODEL_NAME}|v6-rules"
+COMPLETIONS_URL = (f"{AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments/{MODEL_NAME}"
+                   f"/chat/completions?api-version={API_VERSION}")
+
+# Requests allowed in flight at once, to stay under the deployment's rate limit
+MAX_CONCURRENT_REQUESTS = 20
+request_semaphore = None  # created inside the running event loop
+http_client = None  # created inside the running event loop; requests share its HTTP/2 connection
+
+async def chat_completion(prompt: str) -> str:
+    """
+    Send one user prompt to the deployment and return the reply text.
+    """
+    async with request_semaphore:
+        response = await http_client.post(
+            COMPLETIONS_URL,
+            headers={"api-key": AZURE_OPENAI_KEY},
+            json={
+                # The fixed rules come first, so every request shares the same cacheable prefix
+                "messages": [{"role": "system", "content": TRANSLATION_RULES},
+                             {"role": "user", "content": prompt}],
+                "temperature": TEMPERATURE,
+                "seed": SEED,
+            },
+        )
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+# Patterns used by should_translate_text, compiled once
+_RE_NUM = re.compile(r'^\d+$')
+_RE_CURRENCY = re.compile(r'^\$\d+([,\d]*\.?\d*)?$')
+_RE_CODE = re.compile(r'^[A-Z0-9]{3,}$')
+_SKIP_ABBREVS = frozenset({'N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC'})
+
+@functools.lru_cache(maxsize=4096)
 def should_translate_text(text: str) -> bool:
     """
     Determine if text should be translated - be more conservative to preserve layout.
@@ -39,15 +74,15 @@ def should_translate_text(text: str) -> bool:
         return False
     
     # Don't translate pure numbers
-    if re.match(r'^\d+$', text):
+    if _RE_NUM.match(text):
         return False
     
     # Don't translate currency amounts
-    if re.match(r'^\$\d+([,\d]*\.?\d*)?$', text):
+    if _RE_CURRENCY.match(text):
         return False
     
     # Don't translate codes/IDs
-    if re.match(r'^[A-Z0-9]{3,}$', text):
+    if _RE_CODE.match(text):
         return False
     
     # Don't translate single characters or very short strings
@@ -55,57 +90,128 @@ def should_translate_text(text: str) -> bool:
         return False
     
     # Don't translate abbreviations
-    if text.upper() in ['N/A', 'MRI', 'MRA', 'PET', 'CT', 'PCP', 'EOC']:
+    if text.upper() in _SKIP_ABBREVS:
         return False
     
-    # Don't translate if it's mostly numbers and special characters
-    alpha_chars = sum(1 for c in text if c.isalpha())
-    if alpha_chars < 3:
+    # Don't translate if it's mostly numbers and special characters;
+    # stop scanning as soon as three letters have been seen
+    alpha_chars = 0
+    for c in text:
+        if c.isalpha():
+            alpha_chars += 1
+            if alpha_chars >= 3:
+                break
+    else:
         return False
     
     return True
 
-def translate_text_conservative(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
+# Short terms with a fixed translation, answered without calling the model
+COMMON_TERMS = {
+    'copay': 'copago',
+    'deductible': 'deducible',
+    'premium': 'prima',
+    'plan': 'plan',
+    'year': 'año',
+    'services': 'servicios',
+    'coverage': 'cobertura',
+    'benefits': 'beneficios',
+    'maximum': 'máximo',
+    'monthly': 'mensual',
+    'medical': 'médico',
+    'hospital': 'hospital',
+    'inpatient': 'hospitalización',
+    'outpatient': 'ambulatorio'
+}
+
+# Spans sent per batched request, capped by their total length
+BATCH_MAX_ITEMS = 10
+BATCH_MAX_CHARS = 3000
+
+TRANSLATION_RULES = """You translate English text from medical insurance documents.
+
+RULES:
+1. Keep ALL numbers and currency exactly as they are
+2. Keep ALL codes unchanged: H5619136002, N/A, etc.
+3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
+4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
+5. Use standard medical/insurance Spanish terminology
+6. Keep formatting and punctuation exactly the same
+7. Return ONLY the translation, no explanations"""
+
+# (text, target_lang) -> translation for this process, least recently used first;
+# sits in front of the on-disk cache so repeated headers and labels skip SQLite too
+TRANSLATION_MEMORY_SIZE = 8192
+_translation_memory: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+def get_cached_translation(text: str, target_lang: str) -> Optional[str]:
     """
-    Conservative translation that preserves structure.
+    Return a translation from memory or the on-disk cache, or None.
+    """
+    key = (text, target_lang)
+    translated = _translation_memory.get(key)
+    if translated is not None:
+        _translation_memory.move_to_end(key)
+        return translated
+    translated = cache.get(make_key(text, target_lang, CACHE_NAMESPACE, TEMPERATURE))
+    if translated is not None:
+        _remember(key, translated)
+    return translated
+
+def _remember(key: Tuple[str, str], translated: str) -> None:
+    _translation_memory[key] = translated
+    if len(_translation_memory) > TRANSLATION_MEMORY_SIZE:
+        _translation_memory.popitem(last=False)
+
+def store_translations(translations: Dict[str, str], target_lang: str) -> None:
+    """
+    Remember new translations in memory and write them to disk in one transaction.
+    """
+    for text, translated in translations.items():
+        _remember((text, target_lang), translated)
+    cache.seed({make_key(text, target_lang, CACHE_NAMESPACE, TEMPERATURE): translated
+                for text, translated in translations.items()})
+
+def local_translation(text: str) -> Optional[str]:
+    """
+    Translation that needs no model call: the text itself if it should not be translated,
+    or a common term. None if the model has to translate it.
     """
     if not should_translate_text(text):
         return text
     
     # For very short text, be extra careful
     if len(text.split()) <= 2:
-        # Check if it's a common term
-        common_terms = {
-            'copay': 'copago',
-            'deductible': 'deducible',
-            'premium': 'prima',
-            'plan': 'plan',
-            'year': 'año',
-            'services': 'servicios',
-            'coverage': 'cobertura',
-            'benefits': 'beneficios',
-            'maximum': 'máximo',
-            'monthly': 'mensual',
-            'medical': 'médico',
-            'hospital': 'hospital',
-            'inpatient': 'hospitalización',
-            'outpatient': 'ambulatorio'
-        }
-        
         lower_text = text.lower().strip()
-        if lower_text in common_terms:
-            return common_terms[lower_text]
+        if lower_text in COMMON_TERMS:
+            return COMMON_TERMS[lower_text]
     
-    prompt = f"""Translate this English text to {target_lang}. This is from a medical insurance document.
+    return None
 
-RULES:
-1. Keep ALL numbers and currency exactly as they are
-2. Keep ALL codes unchanged: H5619136002, N/A, etc.
-3. Keep proper nouns: Apple Health, Medicaid, Medicare Part A, Part B, Part D
-4. Keep abbreviations: MRI, CT, PET, MRA, PCP, EOC
-5. Use standard medical/insurance Spanish terminology
-6. Keep formatting and punctuation exactly the same
-7. Return ONLY the translation, no explanations
+def clean_translation(translated: str, target_lang: str) -> str:
+    """
+    Strip quotes and common response prefixes from a model translation.
+    """
+    translated = translated.strip()
+    translated = translated.replace('"', '').replace("'", "")
+    
+    # Clean up common response prefixes
+    prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
+    for prefix in prefixes:
+        if translated.startswith(prefix):
+            translated = translated[len(prefix):].strip()
+    
+    return translated
+
+async def translate_text_conservative(text: str, target_lang: str = "Spanish", retries: int = 3) -> str:
+    """
+    Conservative translation that preserves structure.
+    """
+    local = local_translation(text)
+    if local is not None:
+        return local
+    
+    prompt = f"""Translate this English text to {target_lang}.
 
 Text: "{text}"
 
@@ -113,33 +219,115 @@ Translation:"""
     
     for attempt in range(retries):
         try:
-            response = llm.invoke(prompt) 
-            #translated = response.choices[0].message.content.strip()
-            translated = response.content.strip()
-            translated = translated.replace('"', '').replace("'", "")
-            
-            # Clean up common response prefixes
-            prefixes = ['Translation:', 'Traducción:', f'{target_lang}:', 'Spanish:']
-            for prefix in prefixes:
-                if translated.startswith(prefix):
-                    translated = translated[len(prefix):].strip()
-            
-            return translated
+            return clean_translation(await chat_completion(prompt), target_lang)
             
         except Exception as e:
             print(f"Translation attempt {attempt + 1} failed: {e}")
             if attempt < retries - 1:
-                time.sleep(2 ** attempt)
+                await asyncio.sleep(2 ** attempt)
     
     return text
 
-def get_font_info(span: Dict[str, Any]) -> Dict[str, Any]:
+def chunk_texts(texts: List[str]) -> List[List[str]]:
     """
-    Extract font information with better defaults and available fonts.
+    Group texts into batches of at most BATCH_MAX_ITEMS items and BATCH_MAX_CHARS characters.
     """
-    font_name = span.get('font', '').lower()
-    flags = span.get('flags', 0)
-    size = span.get('size', 12)
+    batches, batch, size = [], [], 0
+    for text in texts:
+        if batch and (len(batch) >= BATCH_MAX_ITEMS or size + len(text) > BATCH_MAX_CHARS):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def parse_json_array(content: str) -> List[Any]:
+    """
+    Parse a JSON array from a model reply, tolerating a ```json fence around it.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").strip()
+        if content.lower().startswith("json"):
+            content = content[4:]
+    result = json.loads(content)
+    if not isinstance(result, list):
+        raise ValueError("reply is not a JSON array")
+    return result
+
+async def translate_batch(texts: List[str], target_lang: str = "Spanish") -> List[str]:
+    """
+    Translate several texts with one request that returns a JSON array; a reply that
+    fails or is misaligned is retried as two half-size batches.
+    """
+    if len(texts) == 1:
+        return [await translate_text_conservative(texts[0], target_lang)]
+    
+    prompt = f"""Translate each English segment in this JSON array to {target_lang}.
+Return ONLY a JSON array of strings with the translations in the same order.
+
+{json.dumps(texts, ensure_ascii=False)}"""
+    
+    try:
+        translations = parse_json_array(await chat_completion(prompt))
+        if len(translations) == len(texts) and all(isinstance(t, str) for t in translations):
+            return [clean_translation(t, target_lang) for t in translations]
+        print(f"Batch reply had {len(translations)} items for {len(texts)} texts, splitting the batch")
+    except Exception as e:
+        print(f"Batch translation of {len(texts)} texts failed, splitting the batch: {e}")
+    
+    # Halving keeps a bad batch to a few requests; only the last one or two texts go alone
+    if len(texts) <= 2:
+        return list(await asyncio.gather(*[translate_text_conservative(text, target_lang) for text in texts]))
+    half = len(texts) // 2
+    first, second = await asyncio.gather(translate_batch(texts[:half], target_lang),
+                                         translate_batch(texts[half:], target_lang))
+    return first + second
+
+async def translate_texts(texts: List[str], target_lang: str = "Spanish") -> Dict[str, str]:
+    """
+    Translate texts (repeats allowed) with all batches in flight together; returns text -> translation.
+    """
+    global request_semaphore, http_client
+    request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    # Numbers, codes, common terms and cached texts never reach the model;
+    # other texts are sent once each
+    translations = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        local = local_translation(text)
+        if local is None:
+            local = get_cached_translation(text, target_lang)
+        if local is not None:
+            translations[text] = local
+        else:
+            pending.append(text)
+    print(f"   {len(translations)} answered locally, {len(pending)} to translate")
+    
+    batches = chunk_texts(pending)
+    new_translations = {}
+    limits = httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS)
+    async with httpx.AsyncClient(verify=ctx, http2=True, limits=limits, timeout=60) as http_client:
+        tasks = [asyncio.create_task(translate_batch(batch, target_lang)) for batch in batches]
+        for batch, results in zip(batches, await asyncio.gather(*tasks)):
+            new_translations.update(zip(batch, results))
+    translations.update(new_translations)
+    
+    # One transaction for the whole document; unchanged text may be a failed request, so it is not stored
+    store_translations({text: translated for text, translated in new_translations.items() if translated != text},
+                       target_lang)
+    
+    return translations
+
+@functools.lru_cache(maxsize=256)
+def get_font_name(font_name: str, flags: int) -> str:
+    """
+    Standard font for a span's font name and flags; a document only has a few distinct pairs.
+    """
+    font_name = font_name.lower()
     
     # Determine font type
     is_bold = 'bold' in font_name or (flags & 16)
@@ -147,31 +335,13 @@ def get_font_info(span: Dict[str, Any]) -> Dict[str, Any]:
     
     # Use standard fonts that are always available
     if is_bold and is_italic:
-        font = "helv-boldoblique"
+        return "helv-boldoblique"
     elif is_bold:
-        font = "helv-bold"
+        return "helv-bold"
     elif is_italic:
-        font = "helv-oblique"
+        return "helv-oblique"
     else:
-        font = "helv"
-    
-    return {
-        'font': font,
-        'size': max(6, min(size, 24)),  # Reasonable size limits
-        'color': span.get('color', 0),
-        'flags': flags
-    }
-
-def calculate_text_dimensions(text: str, font_size: float) -> Tuple[float, float]:
-    """
-    Calculate approximate text dimensions.
-    """
-    # Average character width is approximately 0.6 of font size for Helvetica
-    avg_char_width = font_size * 0.6
-    text_width = len(text) * avg_char_width
-    text_height = font_size * 1.2  # Include some line spacing
-    
-    return text_width, text_height
+        return "helv"
 
 def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float, float], 
                               text: str, font_info: Dict[str, Any]) -> bool:
@@ -263,29 +433,120 @@ def insert_text_with_fallbacks(page: fitz.Page, bbox: Tuple[float, float, float,
     except:
         return False
 
-def create_better_redaction_rect(bbox: Tuple[float, float, float, float], 
-                                text: str, font_size: float) -> fitz.Rect:
+def create_better_redaction_rects(bboxes: np.ndarray, texts: List[str], font_sizes: np.ndarray) -> np.ndarray:
     """
-    Create a more accurate redaction rectangle.
+    Create more accurate redaction rectangles for a page's spans at once (N x 4).
     """
-    x0, y0, x1, y1 = bbox
-    
-    # Calculate text dimensions
-    text_width, text_height = calculate_text_dimensions(text, font_size)
-    
-    # Use the larger of the original bbox or calculated dimensions
-    width = max(x1 - x0, text_width)
-    height = max(y1 - y0, text_height)
+    # Use the larger of the original bbox or the estimated text dimensions
+    # (average Helvetica character ~0.6 of the font size, line ~1.2 of it)
+    lengths = np.array([len(text) for text in texts], dtype=np.float32)
+    widths = np.maximum(bboxes[:, 2] - bboxes[:, 0], lengths * font_sizes * 0.6)
+    heights = np.maximum(bboxes[:, 3] - bboxes[:, 1], font_sizes * 1.2)
     
     # Add small padding
     padding = 1
     
-    return fitz.Rect(
-        x0 - padding,
-        y0 - padding,
-        x0 + width + padding,
-        y0 + height + padding
-    )
+    x0, y0 = bboxes[:, 0], bboxes[:, 1]
+    return np.stack([x0 - padding, y0 - padding, x0 + widths + padding, y0 + heights + padding], axis=1)
+
+# Text extraction without image blocks: "dict" output otherwise carries every image's encoded bytes
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def extract_page(page: fitz.Page) -> Dict[str, Any]:
+    """
+    Extract a page's text spans individually, as parallel columns: texts and font names
+    as lists, numeric attributes as NumPy arrays.
+    """
+    spans = [span for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"] if "lines" in block
+             for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+    
+    bboxes = np.array([span["bbox"] for span in spans], dtype=np.float32).reshape(-1, 4)
+    # Keep spans with a valid bbox, all at once
+    valid = np.flatnonzero((bboxes[:, 2] > bboxes[:, 0]) & (bboxes[:, 3] > bboxes[:, 1]))
+    spans = [spans[i] for i in valid]
+    
+    return {
+        'text': [span["text"] for span in spans],
+        'bbox': bboxes[valid],
+        'font': [get_font_name(span.get('font', ''), span.get('flags', 0)) for span in spans],
+        'size': np.clip(np.array([span.get('size', 12) for span in spans], dtype=np.float32), 6, 24),  # Reasonable size limits
+        'color': np.array([span.get('color', 0) for span in spans], dtype=np.uint32),
+        'flags': np.array([span.get('flags', 0) for span in spans], dtype=np.int32),
+    }
+
+def write_page(page: fitz.Page, columns: Dict[str, Any]) -> None:
+    """
+    Redact a page's translated spans and insert the translations in their place.
+    """
+    texts, translations, bboxes = columns['text'], columns['translated'], columns['bbox']
+    print(f"   Found {len(texts)} individual text spans")
+    
+    # Process each span individually to maintain exact positioning;
+    # only spans whose translation is different are redacted and rewritten
+    indices = []
+    for i, (text, translated) in enumerate(zip(texts, translations)):
+        print(f"   Processing: '{text}' -> '{translated}'")
+        if translated != text:
+            indices.append(i)
+    
+    print(f"   Will translate {len(indices)} spans")
+    
+    # First, add all redaction rectangles
+    redact_rects = create_better_redaction_rects(bboxes[indices], [texts[i] for i in indices], columns['size'][indices])
+    for rect in redact_rects.tolist():
+        page.add_redact_annot(fitz.Rect(rect), fill=(1, 1, 1))  # White fill
+    
+    # Apply all redactions at once; images under the rects are left alone rather than re-encoded
+    page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+    
+    # Insert translated text in exact same positions
+    successful_insertions = 0
+    for i in indices:
+        translated = translations[i]
+        bbox = tuple(bboxes[i].tolist())
+        font_info = {
+            'font': columns['font'][i],
+            'size': float(columns['size'][i]),
+            'color': int(columns['color'][i]),
+            'flags': int(columns['flags'][i]),
+        }
+        
+        if insert_text_with_fallbacks(page, bbox, translated, font_info):
+            successful_insertions += 1
+        else:
+            print(f"   Failed to insert: '{translated}' at {bbox}")
+    
+    print(f"   Successfully inserted {successful_insertions}/{len(indices)} translations")
+
+# Processes that rewrite page ranges. Each one reopens the input and its part is
+# merged back at the end, so a worker is only worth it for a few pages or more
+MAX_WORKERS = 8
+MIN_PAGES_PER_WORKER = 4
+
+def write_pages(doc: fitz.Document, lo: int, hi: int, page_columns: List[Dict[str, Any]]) -> None:
+    """
+    Write the translations of pages [lo, hi) into the document.
+    """
+    for page_num in range(lo, hi):
+        print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
+        try:
+            write_page(doc[page_num], page_columns[page_num - lo])
+        except Exception as e:
+            print(f"   Error processing page {page_num + 1}: {e}")
+            traceback.print_exc()
+
+def _process_page_range(args: Tuple[str, int, int, List[Dict[str, Any]], str]) -> str:
+    """
+    Worker: write pages [lo, hi) of the input PDF and save them to tmp_path.
+    """
+    input_pdf_path, lo, hi, page_columns, tmp_path = args
+    doc = fitz.open(input_pdf_path)
+    write_pages(doc, lo, hi, page_columns)
+    doc.select(list(range(lo, hi)))
+    # Garbage collection drops the objects of pages outside this range
+    doc.save(tmp_path, garbage=4, deflate=True)
+    doc.close()
+    return tmp_path
 
 def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, target_lang: str = "Spanish") -> None:
     """
@@ -294,86 +555,55 @@ def translate_pdf_layout_preserving(input_pdf_path: str, output_pdf_path: str, t
     doc = fitz.open(input_pdf_path)
     print(f"🔄 Starting layout-preserving translation of {len(doc)} pages to {target_lang}")
 
+    # Pass 1: extract text spans individually to preserve exact positioning
+    page_columns = []
     for page_num, page in enumerate(doc):
-        print(f"\n📄 Processing page {page_num + 1}/{len(doc)}")
-        
         try:
-            # Extract text spans individually to preserve exact positioning
-            blocks = page.get_text("dict")["blocks"]
-            individual_spans = []
-            
-            for block in blocks:
-                if "lines" not in block:
-                    continue
-                
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        text = span["text"]
-                        if text and text.strip():
-                            bbox = span["bbox"]
-                            if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
-                                individual_spans.append({
-                                    'text': text,
-                                    'bbox': bbox,
-                                    'font_info': get_font_info(span)
-                                })
-            
-            print(f"   Found {len(individual_spans)} individual text spans")
-            
-            # Process each span individually to maintain exact positioning
-            translation_tasks = []
-            for span in individual_spans:
-                text = span['text']
-                
-                print(f"   Processing: '{text}' -> ", end="")
-                
-                translated = translate_text_conservative(text, target_lang)
-                print(f"'{translated}'")
-                
-                # Only add to tasks if translation is different
-                if translated != text:
-                    translation_tasks.append({
-                        'original': text,
-                        'translated': translated,
-                        'bbox': span['bbox'],
-                        'font_info': span['font_info']
-                    })
-            
-            print(f"   Will translate {len(translation_tasks)} spans")
-            
-            # First, collect all redaction rectangles
-            redaction_rects = []
-            for task in translation_tasks:
-                bbox = task['bbox']
-                font_size = task['font_info']['size']
-                redact_rect = create_better_redaction_rect(bbox, task['original'], font_size)
-                redaction_rects.append(redact_rect)
-                page.add_redact_annot(redact_rect, fill=(1, 1, 1))  # White fill
-            
-            # Apply all redactions at once
-            page.apply_redactions()
-            
-            # Insert translated text in exact same positions
-            successful_insertions = 0
-            for task in translation_tasks:
-                translated = task['translated']
-                bbox = task['bbox']
-                font_info = task['font_info']
-                
-                if insert_text_with_fallbacks(page, bbox, translated, font_info):
-                    successful_insertions += 1
-                else:
-                    print(f"   Failed to insert: '{translated}' at {bbox}")
-            
-            print(f"   Successfully inserted {successful_insertions}/{len(translation_tasks)} translations")
-            
+            columns = extract_page(page)
         except Exception as e:
-            print(f"   Error processing page {page_num + 1}: {e}")
+            print(f"   Error reading page {page_num + 1}: {e}")
             traceback.print_exc()
-            continue
+            columns = {'text': [], 'bbox': np.empty((0, 4), dtype=np.float32), 'size': np.empty(0, dtype=np.float32)}
+        page_columns.append(columns)
+
+    # Pass 2: translate every span of the document concurrently
+    all_texts = [text for columns in page_columns for text in columns['text']]
+    print(f"🌐 Translating {len(all_texts)} text spans")
+    translations = asyncio.run(translate_texts(all_texts, target_lang))
+    for columns in page_columns:
+        columns['translated'] = [translations[text] for text in columns['text']]
+
+    # Pass 3: pages are independent, so page ranges are redacted and rewritten in parallel processes
+    # (PyMuPDF documents cannot be shared between threads)
+    total_pages = len(doc)
+    workers = max(1, min(multiprocessing.cpu_count(), MAX_WORKERS, total_pages // MIN_PAGES_PER_WORKER))
+    if workers == 1:
+        # A single range is rewritten in place, without the split and merge
+        write_pages(doc, 0, total_pages, page_columns)
+    else:
+        metadata, toc = doc.metadata, doc.get_toc(simple=False)
+        doc.close()
+        bounds = [round(i * total_pages / workers) for i in range(workers + 1)]
+        tmp_dir = tempfile.mkdtemp(prefix="pdf-translate-")
+        try:
+            tasks = [(input_pdf_path, bounds[i], bounds[i + 1], page_columns[bounds[i]:bounds[i + 1]],
+                      os.path.join(tmp_dir, f"part_{i}.pdf")) for i in range(workers)]
+            with multiprocessing.Pool(workers) as pool:
+                part_paths = pool.map(_process_page_range, tasks)
+
+            # Merge the page ranges in order; the merged document starts empty, so it
+            # takes the input's metadata and outline
+            doc = fitz.open()
+            for part_path in part_paths:
+                with fitz.open(part_path) as part:
+                    doc.insert_pdf(part)
+            doc.set_metadata(metadata)
+            doc.set_toc(toc)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    # Save the document
-    doc.save(output_pdf_path)
+    # Merge duplicate objects (e.g. the font embedded by every part) and compress streams
+    doc.save(output_pdf_path, garbage=4, deflate=True, deflate_images=True, clean=True)
     doc.close()
     print(f"\n✅ Translation completed! Saved to: {output_pdf_path}")
 